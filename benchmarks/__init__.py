@@ -0,0 +1,80 @@
+"""
+Benchmarks for the polls request paths.
+
+Each module can be run on its own, e.g. ``python -m benchmarks.ingest``;
+the load test of every page is ``python manage.py benchmark``.
+They run against a throwaway test database, never against db.sqlite3.
+On SQLite that database is a temporary file rather than the in-memory
+test database, so concurrent workers see real WAL locking.
+"""
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+
+
+def bootstrap():
+    """Configure Django for a standalone benchmark script"""
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "mysite.settings")
+    import django
+    django.setup()
+
+
+@contextmanager
+def test_database():
+    """Create a fresh test database for the duration of the block"""
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    with tempfile.TemporaryDirectory() as directory:
+        if connection.vendor == 'sqlite':
+            connection.settings_dict['TEST']['NAME'] = os.path.join(directory, 'benchmark.sqlite3')
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            yield connection
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+
+def without_rate_limits():
+    """
+    Settings override turning the rate limits off: a benchmark sends every
+    request from a handful of clients, the limits would answer most votes
+    with 429.
+    """
+    from django.test.utils import override_settings
+    return override_settings(POLLS_RATE_LIMIT_ENABLED=False)
+
+
+def release_connection():
+    """Close the connection of the seeding thread, so it is not shared with the workers"""
+    from django.db import connection
+    connection.close()
+
+
+@contextmanager
+def timer(result, key):
+    """Store the elapsed wall time of the block in result[key]"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        result[key] = time.perf_counter() - start
+
+
+def percentile(samples, fraction):
+    """Sample at the given fraction of the sorted samples"""
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def summarize(latencies, elapsed):
+    """Throughput and latency percentiles of a run"""
+    return {
+        'requests_per_sec': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+    }
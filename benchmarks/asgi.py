@@ -0,0 +1,131 @@
+"""
+Compare the async views under ASGI with the sync views under WSGI.
+
+Both run in process: the WSGI side through django.test.Client in a
+thread pool, the ASGI side through django.test.AsyncClient on one event
+loop. Reports requests/sec and p50/p95/p99 latency per page.
+
+    python -m benchmarks.asgi --requests 500 --concurrency 16
+"""
+import argparse
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from . import bootstrap, summarize, test_database, without_rate_limits
+
+
+def seed():
+    import datetime
+    from django.contrib.auth.models import User
+    from django.utils import timezone
+    from polls.models import Choice, Question
+
+    now = timezone.now()
+    questions = Question.objects.bulk_create(
+        Question(question_text=f"Question {n}", pub_date=now - datetime.timedelta(days=n + 1))
+        for n in range(10)
+    )
+    question = Question.objects.order_by('-pub_date').first()
+    Choice.objects.bulk_create(Choice(question=question, choice_text=f"Choice {n}") for n in range(5))
+    user = User.objects.create_user(username="bench", password="bench-password")
+    return question, list(question.choice_set.all()), user, len(questions)
+
+
+def requests_for(page, question, choices):
+    """(method, url, data) of the page under test"""
+    from django.urls import reverse
+
+    if page == 'index':
+        return 'get', reverse('polls:index'), None
+    if page == 'results':
+        return 'get', reverse('polls:results', args=(question.id,)), None
+    return 'post', reverse('polls:vote', args=(question.id,)), {'choice': choices[0].id}
+
+
+def run_wsgi(page, question, choices, user, total, concurrency):
+    from django.db import connection
+    from django.test import Client
+
+    method, url, data = requests_for(page, question, choices)
+
+    def worker(count):
+        client = Client()
+        client.force_login(user)
+        latencies = []
+        for _ in range(count):
+            start = time.perf_counter()
+            getattr(client, method)(url, data)
+            latencies.append(time.perf_counter() - start)
+        connection.close()
+        return latencies
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = pool.map(worker, [total // concurrency] * concurrency)
+        latencies = [sample for result in results for sample in result]
+    return summarize(latencies, time.perf_counter() - start)
+
+
+def run_asgi(page, question, choices, user, total, concurrency):
+    from django.test import AsyncClient
+    from django.test.utils import override_settings
+    from django.urls import include, path
+    from polls import async_views
+    from polls.urls import build_urlpatterns
+
+    class AsyncUrls:
+        urlpatterns = [
+            path('polls/', include((build_urlpatterns(async_views), 'polls'))),
+            path('accounts/', include('django.contrib.auth.urls')),
+        ]
+
+    with override_settings(ROOT_URLCONF=AsyncUrls):
+        method, url, data = requests_for(page, question, choices)
+        client = AsyncClient()
+        client.force_login(user)
+
+        async def worker(count):
+            latencies = []
+            for _ in range(count):
+                start = time.perf_counter()
+                await getattr(client, method)(url, data)
+                latencies.append(time.perf_counter() - start)
+            return latencies
+
+        async def main():
+            start = time.perf_counter()
+            results = await asyncio.gather(*(worker(total // concurrency) for _ in range(concurrency)))
+            return [sample for result in results for sample in result], time.perf_counter() - start
+
+        latencies, elapsed = asyncio.run(main())
+    return summarize(latencies, elapsed)
+
+
+def run(total, concurrency, pages):
+    question, choices, user, _ = seed()
+    report = {'requests': total, 'concurrency': concurrency}
+    with without_rate_limits():
+        for page in pages:
+            report[page] = {
+                'wsgi': run_wsgi(page, question, choices, user, total, concurrency),
+                'asgi': run_asgi(page, question, choices, user, total, concurrency),
+            }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=400)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--pages', nargs='+', default=['index', 'results', 'vote'],
+                        choices=['index', 'results', 'vote'])
+    args = parser.parse_args()
+    bootstrap()
+    with test_database():
+        print(json.dumps(run(args.requests, args.concurrency, args.pages), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+"""
+Concurrent votes for one choice counted three ways: a single counter row
+(Choice.vote_count), sharded counter rows (VoteShard), and no counter at
+all, inserting a Vote row and reading COUNT(*). Then the whole vote path,
+Vote.objects.cast, with and without shards: unsharded it also bumps the
+question's vote version and the history buckets, sharded it leaves both
+to compaction.
+
+Every worker thread runs its writes in their own transactions, like the
+vote view. The report has writes/sec, write latency percentiles and the
+time of one read of the total for each strategy. SQLite serializes all
+writers on the database file, so the difference between the single row
+and the shards only shows up on a server database (DATABASE_URL).
+
+    python -m benchmarks.counters --writes 200 --concurrency 8 --shards 8
+"""
+import argparse
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from . import bootstrap, release_connection, summarize, test_database
+
+
+def seed(voters):
+    import datetime
+    from django.contrib.auth.models import User
+    from django.utils import timezone
+    from polls.models import Question
+
+    question = Question.objects.create(question_text="Benchmark", pub_date=timezone.now() - datetime.timedelta(days=1))
+    users = User.objects.bulk_create(User(username=f"bench{n}") for n in range(voters))
+    return question, users
+
+
+def strategies(question, users, shards):
+    """(POLLS_VOTE_SHARDS, write one vote, read the total) for each counting strategy, one choice each"""
+    from django.db.models import F
+    from polls.models import Choice, Vote, VoteShard
+
+    choices = {
+        name: Choice.objects.create(question=question, choice_text=name)
+        for name in ('single_row', 'sharded', 'count', 'cast', 'cast_sharded')
+    }
+    voters = iter(users)
+
+    def single_row_write():
+        choice = choices['single_row']
+        Choice.objects.filter(pk=choice.pk).update(vote_count=F('vote_count') + 1)
+
+    def sharded_write():
+        choice = choices['sharded']
+        VoteShard.objects.add({choice.pk: 1}, {choice.pk: question.pk})
+
+    def count_write():
+        # user is nullable, so anonymous rows do not hit the one-vote-per-user constraint
+        Vote.objects.create(question=question, choice=choices['count'])
+
+    def cast_write(name):
+        # a fresh voter every time, so each write is a first vote
+        return lambda: Vote.objects.cast(next(voters), choices[name])
+
+    def total(name):
+        return lambda: Choice.objects.with_votes().get(pk=choices[name].pk).votes
+
+    return {
+        'single_row': (0, single_row_write, total('single_row')),
+        'sharded': (shards, sharded_write, total('sharded')),
+        'count': (0, count_write, lambda: Vote.objects.filter(choice=choices['count']).count()),
+        'cast': (0, cast_write('cast'), total('cast')),
+        'cast_sharded': (shards, cast_write('cast_sharded'), total('cast_sharded')),
+    }
+
+
+def drive(write, writes, concurrency):
+    """Run writes transactions of write from concurrency threads, return latencies and elapsed time"""
+    from django.db import connection, transaction
+
+    per_worker = max(1, writes // concurrency)
+
+    def worker(n):
+        latencies = []
+        for _ in range(per_worker):
+            start = time.perf_counter()
+            with transaction.atomic():
+                write()
+            latencies.append(time.perf_counter() - start)
+        connection.close()
+        return latencies
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = list(pool.map(worker, range(concurrency)))
+    return [latency for latencies in results for latency in latencies], time.perf_counter() - start
+
+
+def run(writes, concurrency, shards):
+    from django.db import connection
+    from django.test.utils import override_settings
+
+    # both cast strategies need a voter per write
+    question, users = seed(2 * max(writes, concurrency))
+    plan = strategies(question, users, shards)
+    release_connection()
+    report = {'writes': writes, 'concurrency': concurrency, 'shards': shards, 'vendor': connection.vendor}
+    for name, (shard_setting, write, read) in plan.items():
+        with override_settings(POLLS_VOTE_SHARDS=shard_setting):
+            latencies, elapsed = drive(write, writes, concurrency)
+            start = time.perf_counter()
+            total = read()
+            read_ms = round((time.perf_counter() - start) * 1000, 3)
+            stats = summarize(latencies, elapsed)
+            report[name] = {
+                'writes_per_sec': stats.pop('requests_per_sec'), **stats, 'read_ms': read_ms, 'total': total,
+            }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--writes', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--shards', type=int, default=8)
+    args = parser.parse_args()
+    bootstrap()
+    with test_database():
+        print(json.dumps(run(args.writes, args.concurrency, args.shards), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""
+Compare loading a dataset with loaddata against import_polls.
+
+    python -m benchmarks.fixtures --questions 50 --users 2000
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+from io import StringIO
+
+from . import bootstrap, test_database
+
+
+def seed(questions, choices, users):
+    """Bulk insert questions, their choices, users, and one vote per user and question"""
+    import datetime
+    from django.contrib.auth.models import User
+    from django.utils import timezone
+    from polls.models import Choice, Question, Vote
+
+    now = timezone.now()
+    Question.objects.bulk_create(
+        Question(question_text=f"Question {n}", pub_date=now - datetime.timedelta(days=n))
+        for n in range(questions)
+    )
+    question_ids = list(Question.objects.values_list('pk', flat=True))
+    Choice.objects.bulk_create(
+        Choice(question_id=question_id, choice_text=f"Choice {n}")
+        for question_id in question_ids for n in range(choices)
+    )
+    User.objects.bulk_create(User(username=f"bench{n}", password="!") for n in range(users))
+    user_ids = list(User.objects.values_list('pk', flat=True))
+    for question_id in question_ids:
+        choice_ids = list(Choice.objects.filter(question_id=question_id).values_list('pk', flat=True))
+        Vote.objects.bulk_create(
+            (Vote(user_id=user_id, question_id=question_id, choice_id=choice_ids[n % choices])
+             for n, user_id in enumerate(user_ids)),
+            batch_size=2000,
+        )
+    return Vote.objects.count()
+
+
+def measure(func):
+    """Run func and return (seconds, peak traced memory in MiB)"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    func()
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return round(seconds, 3), round(peak / 2 ** 20, 1)
+
+
+def wipe():
+    from django.contrib.auth.models import User
+    from polls.models import Question
+
+    Question.objects.all().delete()
+    User.objects.all().delete()
+
+
+def run(questions, choices, users, chunk_size):
+    from django.core.management import call_command
+
+    result = {'questions': questions, 'choices': choices, 'users': users}
+    result['votes'] = seed(questions, choices, users)
+    with tempfile.TemporaryDirectory() as directory:
+        fixture = os.path.join(directory, 'polls.json')
+        lines = os.path.join(directory, 'polls.jsonl')
+        call_command('dumpdata', 'auth.user', 'polls', output=fixture, verbosity=0)
+        call_command('export_polls', output=lines, chunk_size=chunk_size, stderr=StringIO())
+
+        wipe()
+        result['loaddata_seconds'], result['loaddata_peak_mib'] = measure(
+            lambda: call_command('loaddata', fixture, verbosity=0))
+        wipe()
+        result['import_polls_seconds'], result['import_polls_peak_mib'] = measure(
+            lambda: call_command('import_polls', lines, chunk_size=chunk_size, stdout=StringIO()))
+    result['speedup'] = round(result['loaddata_seconds'] / result['import_polls_seconds'], 1)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--questions', type=int, default=20)
+    parser.add_argument('--choices', type=int, default=4)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--chunk-size', type=int, default=2000)
+    args = parser.parse_args()
+    bootstrap()
+    with test_database():
+        print(json.dumps(run(args.questions, args.choices, args.users, args.chunk_size), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+Compare votes/sec of the synchronous vote path with write-behind ingestion.
+
+    python -m benchmarks.ingest --votes 5000
+"""
+import argparse
+import json
+
+from . import bootstrap, test_database, timer
+
+
+def seed(users, choices):
+    """Create one open question with `choices` choices and `users` voters"""
+    import datetime
+    from django.contrib.auth.models import User
+    from django.utils import timezone
+    from polls.models import Choice, Question
+
+    question = Question.objects.create(
+        question_text="Benchmark", pub_date=timezone.now() - datetime.timedelta(days=1)
+    )
+    Choice.objects.bulk_create(
+        Choice(question=question, choice_text=f"Choice {n}") for n in range(choices)
+    )
+    User.objects.bulk_create(User(username=f"bench{n}", password="!") for n in range(users))
+    return question, list(question.choice_set.all()), list(User.objects.all())
+
+
+def post_votes(question, choices, users, votes):
+    """Call the vote view directly for `votes` requests, cycling users and choices"""
+    from django.test import RequestFactory
+    from django.urls import reverse
+    from polls.views import vote
+
+    factory = RequestFactory()
+    url = reverse('polls:vote', args=(question.id,))
+    for n in range(votes):
+        request = factory.post(url, {'choice': choices[n % len(choices)].id})
+        request.user = users[n % len(users)]
+        vote(request, question_id=question.id)
+
+
+def run(votes, users, choices, batch_size):
+    from django.test.utils import override_settings
+    from polls import ingest
+    from polls.models import Vote
+
+    result = {'votes': votes, 'users': users, 'choices': choices, 'batch_size': batch_size}
+    question, choice_list, user_list = seed(users, choices)
+
+    with timer(result, 'sync_seconds'):
+        post_votes(question, choice_list, user_list, votes)
+    Vote.objects.all().delete()
+
+    with override_settings(POLLS_VOTE_INGEST=True, POLLS_VOTE_FLUSH_INTERVAL=0,
+                           POLLS_VOTE_QUEUE_PATH="", POLLS_VOTE_BATCH_SIZE=batch_size):
+        with timer(result, 'ingest_submit_seconds'):
+            post_votes(question, choice_list, user_list, votes)
+        with timer(result, 'ingest_flush_seconds'):
+            ingest.get_ingestor().flush()
+
+    ingest_seconds = result['ingest_submit_seconds'] + result['ingest_flush_seconds']
+    for key in ('sync_seconds', 'ingest_submit_seconds', 'ingest_flush_seconds'):
+        result[key] = round(result[key], 3)
+    result['sync_votes_per_sec'] = round(votes / result['sync_seconds'], 1)
+    result['ingest_votes_per_sec'] = round(votes / ingest_seconds, 1)
+    result['ingest_accept_per_sec'] = round(votes / result['ingest_submit_seconds'], 1)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--votes', type=int, default=2000)
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--choices', type=int, default=4)
+    parser.add_argument('--batch-size', type=int, default=500)
+    args = parser.parse_args()
+    bootstrap()
+    with test_database():
+        print(json.dumps(run(args.votes, args.users, args.choices, args.batch_size), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,200 @@
+"""
+Load test of the index, detail, vote and results pages.
+
+A dataset of questions x choices x users x votes is bulk inserted into
+the throwaway database, then every scenario is driven by concurrent
+workers, each with its own logged in django.test.Client and thread.
+The JSON report has requests/sec, p50/p95/p99 latency and queries per
+request for every scenario. Reports from two commits can be compared
+with ``compare``. Run it through ``python manage.py benchmark``.
+"""
+import datetime
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import StringIO
+
+from . import release_connection, summarize, timer, without_rate_limits
+
+SCENARIOS = ['index', 'detail', 'vote', 'results']
+
+
+class QueryCounter:
+    """Count the queries run on every connection of every thread"""
+
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        with self._lock:
+            self.count += 1
+        return execute(sql, params, many, context)
+
+    def install(self, connection):
+        # outermost, the wrappers added and popped per request stay above it
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.insert(0, self)
+
+    def connection_created(self, sender, connection, **kwargs):
+        self.install(connection)
+
+    def __enter__(self):
+        from django.db import connections
+        from django.db.backends.signals import connection_created
+
+        connection_created.connect(self.connection_created)
+        for connection in connections.all(initialized_only=True):
+            self.install(connection)
+        return self
+
+    def __exit__(self, *exc_info):
+        from django.db import connections
+        from django.db.backends.signals import connection_created
+
+        connection_created.disconnect(self.connection_created)
+        for connection in connections.all(initialized_only=True):
+            if self in connection.execute_wrappers:
+                connection.execute_wrappers.remove(self)
+
+
+def seed(questions, choices, users, votes_per_user, rng):
+    """
+    Bulk insert the dataset: every user votes on votes_per_user
+    questions. Returns the question and choice ids and the users.
+    """
+    from django.contrib.auth.models import User
+    from django.core.management import call_command
+    from django.utils import timezone
+    from polls.models import Choice, Question, Vote
+
+    now = timezone.now()
+    Question.objects.bulk_create(
+        (Question(question_text=f"Question {n}", pub_date=now - datetime.timedelta(hours=n + 1))
+         for n in range(questions)),
+        batch_size=2000,
+    )
+    Question.objects.update_states()
+    question_ids = list(Question.objects.order_by('pk').values_list('pk', flat=True))
+    Choice.objects.bulk_create(
+        (Choice(question_id=question_id, choice_text=f"Choice {n}")
+         for question_id in question_ids for n in range(choices)),
+        batch_size=2000,
+    )
+    choice_ids = {}
+    for choice_id, question_id in Choice.objects.order_by('pk').values_list('pk', 'question_id'):
+        choice_ids.setdefault(question_id, []).append(choice_id)
+    User.objects.bulk_create(
+        (User(username=f"load{n}", password="!") for n in range(users)),
+        batch_size=2000,
+    )
+    user_list = list(User.objects.filter(username__startswith='load').order_by('pk'))
+    per_user = min(votes_per_user, len(question_ids))
+    Vote.objects.bulk_create(
+        (Vote(user_id=user.pk, question_id=question_id, choice_id=rng.choice(choice_ids[question_id]))
+         for n, user in enumerate(user_list)
+         for question_id in (question_ids[(n + k) % len(question_ids)] for k in range(per_user))),
+        batch_size=2000,
+    )
+    call_command('recount_votes', stdout=StringIO())
+    return question_ids, choice_ids, user_list
+
+
+def request_for(scenario, question_id, choice_ids, rng):
+    """(method, url, data) of one request of scenario"""
+    from django.urls import reverse
+
+    if scenario == 'index':
+        return 'get', reverse('polls:index'), None
+    if scenario == 'detail':
+        return 'get', reverse('polls:detail', args=(question_id,)), None
+    if scenario == 'results':
+        return 'get', reverse('polls:results', args=(question_id,)), None
+    return 'post', reverse('polls:vote', args=(question_id,)), {'choice': rng.choice(choice_ids[question_id])}
+
+
+def drive(scenario, question_ids, choice_ids, users, total, concurrency, random_seed):
+    """Send total requests of scenario from concurrency workers, return the scenario's report"""
+    from django.db import connection
+    from django.test import Client
+
+    per_worker = max(1, total // concurrency)
+    clients = []
+    for n in range(concurrency):
+        client = Client()
+        client.force_login(users[n % len(users)])
+        clients.append(client)
+    release_connection()
+
+    def worker(n):
+        rng = random.Random(random_seed + n)
+        client = clients[n]
+        latencies, errors = [], 0
+        for _ in range(per_worker):
+            method, url, data = request_for(scenario, rng.choice(question_ids), choice_ids, rng)
+            start = time.perf_counter()
+            response = getattr(client, method)(url, data)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code >= 400:
+                errors += 1
+        connection.close()
+        return latencies, errors
+
+    with QueryCounter() as counter:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as pool:
+            results = list(pool.map(worker, range(concurrency)))
+        elapsed = time.perf_counter() - start
+    latencies = [sample for samples, _ in results for sample in samples]
+    report = summarize(latencies, elapsed)
+    report['requests'] = len(latencies)
+    report['errors'] = sum(errors for _, errors in results)
+    report['queries_per_request'] = round(counter.count / len(latencies), 2)
+    return report
+
+
+def run(questions=100, choices=4, users=200, votes_per_user=5, requests=400, concurrency=8,
+        scenarios=SCENARIOS, random_seed=0):
+    """Seed the dataset and drive every scenario, return the JSON-ready report"""
+    import django
+
+    dataset = {'questions': questions, 'choices': choices, 'users': users, 'votes_per_user': votes_per_user}
+    with timer(dataset, 'seed_seconds'):
+        question_ids, choice_ids, user_list = seed(
+            questions, choices, users, votes_per_user, random.Random(random_seed))
+    dataset['seed_seconds'] = round(dataset['seed_seconds'], 3)
+    report = {
+        'django': django.get_version(),
+        'dataset': dataset,
+        'requests': requests,
+        'concurrency': concurrency,
+        'scenarios': {},
+    }
+    with without_rate_limits():
+        for scenario in scenarios:
+            report['scenarios'][scenario] = drive(
+                scenario, question_ids, choice_ids, user_list, requests, concurrency, random_seed,
+            )
+    return report
+
+
+def compare(report, baseline, threshold):
+    """
+    Regressions of report against baseline, as messages. Throughput may
+    drop and latency or queries per request may grow by at most
+    threshold percent.
+    """
+    limit = threshold / 100
+    regressions = []
+    for scenario, current in report['scenarios'].items():
+        before = baseline.get('scenarios', {}).get(scenario)
+        if before is None:
+            continue
+        if current['requests_per_sec'] < before['requests_per_sec'] * (1 - limit):
+            regressions.append(
+                f"{scenario}: {current['requests_per_sec']} req/s, was {before['requests_per_sec']}")
+        for key in ('p95_ms', 'queries_per_request'):
+            if current[key] > before[key] * (1 + limit):
+                regressions.append(f"{scenario}: {key} {current[key]}, was {before[key]}")
+    return regressions
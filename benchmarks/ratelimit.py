@@ -0,0 +1,77 @@
+"""
+Cost of a throttled vote against an allowed one.
+
+One client hammers the vote endpoint past its limit; every request is
+timed and its queries counted, split by allowed (302) and throttled
+(429) responses.
+
+    python -m benchmarks.ratelimit --requests 500 --rate 50/m
+"""
+import argparse
+import json
+import logging
+import time
+
+from . import bootstrap, test_database
+
+
+def seed():
+    import datetime
+    from django.contrib.auth.models import User
+    from django.utils import timezone
+    from polls.models import Choice, Question
+
+    question = Question.objects.create(question_text="Benchmark", pub_date=timezone.now() - datetime.timedelta(days=1))
+    choice = Choice.objects.create(question=question, choice_text="Spam")
+    user = User.objects.create_user(username="bench", password="bench-password")
+    return question, choice, user
+
+
+def run(requests, rate, store):
+    from django.db import connection
+    from django.test import Client
+    from django.test.utils import CaptureQueriesContext, override_settings
+    from django.urls import reverse
+
+    # every throttled request logs a warning
+    logging.getLogger('django.request').setLevel(logging.ERROR)
+    question, choice, user = seed()
+    url = reverse('polls:vote', args=(question.id,))
+    samples = {302: [], 429: []}
+    with override_settings(POLLS_RATE_LIMIT_ENABLED=True, POLLS_RATE_LIMITS={'polls:vote': rate},
+                           POLLS_RATE_LIMIT_STORE=store):
+        client = Client()
+        client.force_login(user)
+        for _ in range(requests):
+            with CaptureQueriesContext(connection) as context:
+                start = time.perf_counter()
+                response = client.post(url, {'choice': choice.id})
+                elapsed = time.perf_counter() - start
+            db_time = sum(float(query['time']) for query in context.captured_queries)
+            samples[response.status_code].append((elapsed, len(context.captured_queries), db_time))
+    report = {'requests': requests, 'rate': rate, 'store': store}
+    for status, name in ((302, 'allowed'), (429, 'throttled')):
+        rows = samples[status]
+        if rows:
+            report[name] = {
+                'count': len(rows),
+                'ms_per_request': round(sum(row[0] for row in rows) / len(rows) * 1000, 3),
+                'queries_per_request': round(sum(row[1] for row in rows) / len(rows), 2),
+                'db_ms_per_request': round(sum(row[2] for row in rows) / len(rows) * 1000, 3),
+            }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--rate', default='50/m')
+    parser.add_argument('--store', choices=['memory', 'cache'], default='memory')
+    args = parser.parse_args()
+    bootstrap()
+    with test_database():
+        print(json.dumps(run(args.requests, args.rate, args.store), indent=2))
+
+
+if __name__ == '__main__':
+    main()
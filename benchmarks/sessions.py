@@ -0,0 +1,87 @@
+"""
+Queries per index hit with database sessions and uncached users, before,
+against cached_db sessions and CachedModelBackend, after.
+
+    python -m benchmarks.sessions --requests 200
+"""
+import argparse
+import json
+import time
+
+from . import bootstrap, test_database
+
+CONFIGURATIONS = {
+    'before': {
+        'SESSION_ENGINE': 'django.contrib.sessions.backends.db',
+        'AUTHENTICATION_BACKENDS': ['django.contrib.auth.backends.ModelBackend'],
+    },
+    'after': {
+        # one process, so the locmem cache stands in for a shared one
+        'POLLS_SHARED_CACHE': True,
+        'SESSION_ENGINE': 'django.contrib.sessions.backends.cached_db',
+        'AUTHENTICATION_BACKENDS': ['polls.auth.CachedModelBackend'],
+    },
+}
+
+
+def seed():
+    import datetime
+    from django.contrib.auth.models import User
+    from django.utils import timezone
+    from polls.models import Question
+
+    now = timezone.now()
+    for n in range(10):
+        Question.objects.create(question_text=f"Question {n}", pub_date=now - datetime.timedelta(days=n + 1))
+    return User.objects.create_user(username="bench", password="bench-password")
+
+
+def measure(client, url, requests):
+    """Average queries and milliseconds per GET of url"""
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    client.get(url)
+    start = time.perf_counter()
+    with CaptureQueriesContext(connection) as context:
+        for _ in range(requests):
+            client.get(url)
+    elapsed = time.perf_counter() - start
+    return {
+        'queries_per_request': round(len(context.captured_queries) / requests, 2),
+        'ms_per_request': round(elapsed / requests * 1000, 3),
+    }
+
+
+def run(requests):
+    from django.core.cache import cache
+    from django.test import Client
+    from django.test.utils import override_settings
+    from django.urls import reverse
+
+    user = seed()
+    url = reverse('polls:index')
+    report = {'requests': requests}
+    for name, overrides in CONFIGURATIONS.items():
+        with override_settings(**overrides):
+            cache.clear()
+            logged_in = Client()
+            logged_in.force_login(user)
+            report[name] = {
+                'anonymous_index': measure(Client(), url, requests),
+                'logged_in_index': measure(logged_in, url, requests),
+            }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=200)
+    args = parser.parse_args()
+    bootstrap()
+    with test_database():
+        print(json.dumps(run(args.requests), indent=2))
+
+
+if __name__ == '__main__':
+    main()
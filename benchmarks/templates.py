@@ -0,0 +1,101 @@
+"""
+Render time of each polls template for a question with many choices,
+parsing the template on every render, before, against the cached loader
+warmed at startup, after.
+
+    python -m benchmarks.templates --choices 100 --renders 200
+"""
+import argparse
+import json
+import time
+
+from . import bootstrap, test_database
+
+LOADERS = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+CONFIGURATIONS = {
+    'before': LOADERS,
+    'after': [('django.template.loaders.cached.Loader', LOADERS)],
+}
+
+
+def seed(choices):
+    import datetime
+    from django.contrib.auth.models import User
+    from django.utils import timezone
+    from polls.models import Choice, Question, Vote
+
+    now = timezone.now()
+    for n in range(10):
+        Question.objects.create(question_text=f"Question {n}", pub_date=now - datetime.timedelta(days=n + 2))
+    question = Question.objects.create(question_text="Benchmark", pub_date=now - datetime.timedelta(days=1))
+    Choice.objects.bulk_create(Choice(question=question, choice_text=f"Choice {n}") for n in range(choices))
+    user = User.objects.create_user(username="bench", password="bench-password")
+    Vote.objects.cast(user, question.choice_set.order_by('pk').last())
+    return question, user
+
+
+def contexts(question, user):
+    """The template context each view passes for question, as user"""
+    from django.test import RequestFactory
+    from polls.views import (
+        get_vote_for_user, index_context, index_questions, results_context, results_queryset,
+    )
+
+    request = RequestFactory().get('/polls/')
+    request.user = user
+    questions, next_cursor = index_questions(None, '', None)
+    return request, {
+        'polls/index.html': {'latest_question_list': questions, **index_context(next_cursor, '', None)},
+        'polls/detail.html': {
+            'question': question,
+            'choices': list(question.choice_set.order_by('pk')),
+            'vote': get_vote_for_user(question, user),
+        },
+        'polls/results.html': results_context(results_queryset().get(pk=question.pk)),
+    }
+
+
+def measure(request, name, context, renders):
+    """Average milliseconds to load and render template name"""
+    from django.template.loader import render_to_string
+
+    render_to_string(name, context, request)
+    start = time.perf_counter()
+    for _ in range(renders):
+        render_to_string(name, context, request)
+    return round((time.perf_counter() - start) / renders * 1000, 3)
+
+
+def run(choices, renders):
+    from django.apps import apps
+    from django.conf import settings
+    from django.test.utils import override_settings
+
+    request, templates = contexts(*seed(choices))
+    report = {'choices': choices, 'renders': renders}
+    for name, loaders in CONFIGURATIONS.items():
+        engine = dict(settings.TEMPLATES[0], OPTIONS=dict(settings.TEMPLATES[0]['OPTIONS'], loaders=loaders))
+        with override_settings(TEMPLATES=[engine]):
+            start = time.perf_counter()
+            apps.get_app_config('polls').warm_templates()
+            report[name] = {'warm_up_ms': round((time.perf_counter() - start) * 1000, 3)}
+            for template, context in templates.items():
+                report[name][template] = {'ms_per_render': measure(request, template, context, renders)}
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--choices', type=int, default=100)
+    parser.add_argument('--renders', type=int, default=200)
+    args = parser.parse_args()
+    bootstrap()
+    with test_database():
+        print(json.dumps(run(args.choices, args.renders), indent=2))
+
+
+if __name__ == '__main__':
+    main()
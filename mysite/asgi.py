@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "mysite.settings")
+# Under ASGI the hot polls views run natively async, see polls/async_views.py
+os.environ.setdefault("POLLS_ASYNC_VIEWS", "True")
 
 application = get_asgi_application()
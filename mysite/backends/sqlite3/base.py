@@ -0,0 +1,35 @@
+"""
+SQLite backend tuned for concurrent voting.
+
+Every new connection gets the PRAGMAs listed in the database OPTIONS
+under "pragmas" (WAL journal, busy timeout, synchronous level, ...), and
+transactions start with BEGIN IMMEDIATE. A deferred transaction that
+reads before it writes cannot wait for the write lock and fails at once
+with "database is locked"; an immediate one queues on busy_timeout instead.
+"""
+from django.db.backends.sqlite3 import base
+
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'busy_timeout': 5000,
+    'synchronous': 'NORMAL',
+    'temp_store': 'MEMORY',
+    'cache_size': -20000,
+}
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        self.pragmas = {**DEFAULT_PRAGMAS, **params.pop('pragmas', {})}
+        return params
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute("BEGIN IMMEDIATE")
@@ -0,0 +1,48 @@
+"""
+Settings for running the test suite, used by default by manage.py test.
+
+    python manage.py test polls
+"""
+import os
+import tempfile
+
+from .settings import *  # noqa: F401,F403
+
+# Hashing with the default PBKDF2 takes most of the time of tests that log in
+PASSWORD_HASHERS = [
+    "django.contrib.auth.hashers.MD5PasswordHasher",
+]
+
+# Ids and vote versions repeat between tests, a tally must not outlive its test
+POLLS_TALLY_CACHE_SECONDS = 0
+
+# Test clients all share one IP, limits are switched on by the tests that check them
+POLLS_RATE_LIMIT_ENABLED = False
+
+# No collectstatic manifest is built for the tests, even with DEBUG off
+STORAGES = {
+    **STORAGES,  # noqa: F405
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+}
+
+
+def temporary_test_database(alias):
+    """Path of a throwaway SQLite test database for alias, one per test run"""
+    return os.path.join(tempfile.gettempdir(), f"ku-polls-test-{alias}-{os.getpid()}.sqlite3")
+
+
+# A second SQLite database stands in for a read replica. Routing to it is
+# off, the tests that check it turn it on with POLLS_REPLICA_DATABASE.
+# Both test databases are temporary files, so a test run never touches
+# db.sqlite3 or db_replica.sqlite3, nor another run's databases.
+DATABASES = {
+    **DATABASES,  # noqa: F405
+    "replica": {
+        "ENGINE": "mysite.backends.sqlite3",
+        "NAME": str(BASE_DIR / "db_replica.sqlite3"),  # noqa: F405
+        "TEST": {"NAME": temporary_test_database("replica")},
+    },
+}
+if DATABASES["default"]["ENGINE"] == "mysite.backends.sqlite3":
+    DATABASES["default"] = {**DATABASES["default"], "TEST": {"NAME": temporary_test_database("default")}}
+POLLS_REPLICA_DATABASE = None
@@ -16,10 +16,12 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import include, path
 from . import views
+from polls.views import metrics
 
 urlpatterns = [
     path('', views.index, name='main'),
     path('polls/', include('polls.urls')),
     path("admin/", admin.site.urls),
     path('accounts/', include('django.contrib.auth.urls')),
+    path('metrics', metrics, name='metrics'),
 ]
@@ -1,23 +1,137 @@
+import datetime
+
 from django.contrib import admin
-from .models import Choice, Question
+from django.core.paginator import Paginator
+from django.db import connection
+from django.db.models import BooleanField, Count, ExpressionWrapper, Max, Q
+from django.utils import timezone
+from django.utils.functional import cached_property
+from django.utils.html import format_html_join
+
+from .models import Choice, Question, Vote
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that estimates the size of an unfiltered table instead of
+    running COUNT(*) over it, filtered lists are still counted exactly.
+    """
+
+    @cached_property
+    def count(self):
+        if self.object_list.query.where:
+            return super().count
+        estimate = estimate_row_count(self.object_list.model)
+        return super().count if estimate is None else estimate
+
+
+def estimate_row_count(model):
+    """Approximate number of rows of model's table, None if unknown"""
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE relname = %s", [model._meta.db_table])
+            row = cursor.fetchone()
+        if row and row[0] >= 0:
+            return row[0]
+    # rows are rarely deleted, the highest id is a close upper bound read from the primary key
+    return model.objects.aggregate(Max('pk'))['pk__max'] or 0
 
 
 class ChoiceInline(admin.TabularInline):
-    """Admin start with 3 choice per question"""
+    """
+    Admin start with 3 choice per question. Only one page of existing
+    choices is loaded, selected by the choice_page query parameter.
+    """
     model = Choice
     extra = 3
+    per_page = 50
+    page_param = 'choice_page'
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        object_id = request.resolver_match.kwargs.get('object_id')
+        if object_id is None:
+            return queryset
+        try:
+            page = max(1, int(request.GET.get(self.page_param, 1)))
+        except ValueError:
+            page = 1
+        start = (page - 1) * self.per_page
+        page_ids = Choice.objects.filter(question_id=object_id).order_by('pk').values_list('pk', flat=True)
+        return queryset.filter(pk__in=list(page_ids[start:start + self.per_page])).order_by('pk')
 
 
 class QuestionAdmin(admin.ModelAdmin):
     """Model in admin page"""
     fieldsets = [
-        (None,               {'fields': ['question_text']}),
+        (None,               {'fields': ['question_text', 'choice_pages']}),
         ('Date information', {'fields': ['pub_date', 'end_date'], 'classes': ['collapse']}),
     ]
+    readonly_fields = ['choice_pages']
     inlines = [ChoiceInline]
-    list_display = ('question_text', 'pub_date', 'was_published_recently', 'is_published', 'can_vote')
-    list_filter = ['pub_date']
+    list_display = (
+        'question_text', 'pub_date', 'state', 'published_recently', 'open_for_votes', 'choice_count', 'total_votes',
+    )
+    list_filter = ['state', 'pub_date']
     search_fields = ['question_text']
 
+    def get_queryset(self, request):
+        """Vote totals, choice counts and the boolean columns computed in SQL"""
+        now = timezone.now()
+        return super().get_queryset(request).with_votes().annotate(
+            choice_count=Count('choice'),
+            published_recently=ExpressionWrapper(
+                Q(pub_date__gte=now - datetime.timedelta(days=1), pub_date__lte=now),
+                output_field=BooleanField(),
+            ),
+            open_for_votes=ExpressionWrapper(Q(state=Question.OPEN), output_field=BooleanField()),
+        )
+
+    @admin.display(boolean=True, ordering='published_recently', description='Published recently?')
+    def published_recently(self, question):
+        return question.published_recently
+
+    @admin.display(boolean=True, ordering='open_for_votes', description='Can vote?')
+    def open_for_votes(self, question):
+        return question.open_for_votes
+
+    @admin.display(ordering='choice_count', description='Choices')
+    def choice_count(self, question):
+        return question.choice_count
+
+    @admin.display(ordering='total_votes', description='Votes')
+    def total_votes(self, question):
+        return question.total_votes
+
+    @admin.display(description='Choice pages')
+    def choice_pages(self, question):
+        """Links to each page of the choice inline"""
+        if question.pk is None:
+            return '-'
+        pages = range(1, (question.choice_count - 1) // ChoiceInline.per_page + 2)
+        return format_html_join(
+            ' ', '<a href="?{}={}">{}</a>', ((ChoiceInline.page_param, page, page) for page in pages),
+        )
+
+
+class VoteAdmin(admin.ModelAdmin):
+    """Read-only list of votes"""
+    list_display = ('id', 'user', 'question', 'choice', 'cast_at')
+    list_select_related = ('user', 'question', 'choice')
+    raw_id_fields = ('user', 'question', 'choice')
+    ordering = ('-pk',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
 
 admin.site.register(Question, QuestionAdmin)
+admin.site.register(Vote, VoteAdmin)
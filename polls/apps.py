@@ -1,7 +1,26 @@
+from pathlib import Path
+
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class PollsConfig(AppConfig):
     """Name of app"""
     default_auto_field = "django.db.models.BigAutoField"
     name = "polls"
+
+    def ready(self):
+        """Connect the cache invalidation and live results signals, compile the templates"""
+        from . import pubsub, signals  # noqa: F401
+        if settings.POLLS_WARM_TEMPLATES:
+            self.warm_templates()
+
+    def warm_templates(self):
+        """Compile every template of this app into the cached loader, returns their names"""
+        from django.template.loader import get_template
+
+        root = Path(self.path) / 'templates'
+        names = sorted(path.relative_to(root).as_posix() for path in root.rglob('*.html'))
+        for name in names:
+            get_template(name)
+        return names
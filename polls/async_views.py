@@ -0,0 +1,116 @@
+"""
+Async versions of the index, results and vote views for ASGI servers.
+
+They are routed instead of the sync views when POLLS_ASYNC_VIEWS is on,
+which mysite/asgi.py turns on by default. Queries go through Django's
+async ORM; the vote upsert needs a transaction, so it still runs in the
+thread pool through sync_to_async.
+"""
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.views import redirect_to_login
+from django.http import Http404, HttpResponseBadRequest, HttpResponseRedirect
+from django.shortcuts import render
+from django.db.models import Prefetch, prefetch_related_objects
+from django.urls import reverse
+from django.utils.cache import patch_vary_headers
+from django.views import View
+
+from . import ingest
+from .cache import (
+    aget_index_questions, aget_page, closed_results_page_key, first_index_page, index_page_key, store_page,
+)
+from .models import Choice, Question, Vote
+from .pagination import InvalidPage, index_filters
+from .views import RESULT_CHOICES, find_choice, index_context, index_questions, results_context, results_queryset
+
+
+@sync_to_async
+def aget_user(request):
+    """Resolve the lazy request.user in the thread pool and return it"""
+    request.user.is_authenticated
+    return request.user
+
+
+def async_login_required(view):
+    """login_required for async views"""
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        user = await aget_user(request)
+        if not user.is_authenticated:
+            return redirect_to_login(request.get_full_path())
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+
+async def aget_question(queryset, question_id):
+    """Question with the given id from queryset, or 404"""
+    try:
+        return await queryset.aget(pk=question_id)
+    except Question.DoesNotExist:
+        raise Http404("No question matches the given query.")
+
+
+class IndexView(View):
+    """Index page, shared between visitors without a session"""
+
+    async def get(self, request):
+        try:
+            cursor, q, state = index_filters(request.GET)
+        except InvalidPage as error:
+            return HttpResponseBadRequest(str(error))
+        page = index_page_key(request)
+        response = await aget_page('index', page)
+        if response is None:
+            # index.html reads user, so load it here rather than in the template
+            await aget_user(request)
+            if cursor is None and not q and state is None:
+                questions, next_cursor = first_index_page(await aget_index_questions())
+            else:
+                questions, next_cursor = await sync_to_async(index_questions)(cursor, q, state)
+            context = index_context(next_cursor, q, state)
+            context['latest_question_list'] = questions
+            response = render(request, 'polls/index.html', context)
+            if page:
+                await sync_to_async(store_page)(*page, response)
+        patch_vary_headers(response, ('Cookie',))
+        return response
+
+
+class ResultsView(View):
+    """Result view page, cached once the question is closed"""
+
+    async def get(self, request, question_id):
+        question = await aget_question(results_queryset().prefetch_related(None), question_id)
+        page = closed_results_page_key(question)
+        response = await aget_page('results', page)
+        if response is None:
+            await sync_to_async(prefetch_related_objects)([question], RESULT_CHOICES)
+            response = render(request, 'polls/results.html', results_context(question))
+            if page:
+                await sync_to_async(store_page)(*page, response)
+        return response
+
+
+@async_login_required
+async def vote(request, question_id):
+    """Async version of polls.views.vote"""
+    question = await aget_question(
+        Question.objects.prefetch_related(Prefetch('choice_set', queryset=Choice.objects.order_by('pk'))),
+        question_id,
+    )
+    user = request.user
+    choices = list(question.choice_set.all())
+    selected_choice = find_choice(choices, request.POST.get('choice'))
+    if selected_choice is None:
+        return render(request, 'polls/detail.html', {
+            'question': question,
+            'choices': choices,
+            'error_message': "You didn't select a choice.",
+        })
+    if ingest.is_enabled():
+        await sync_to_async(ingest.get_ingestor().submit)(user.pk, selected_choice.pk)
+    else:
+        await sync_to_async(Vote.objects.cast)(user, selected_choice)
+    return HttpResponseRedirect(reverse('polls:results', args=(question.id,)))
@@ -0,0 +1,60 @@
+"""
+Authentication backend that keeps users in the cache.
+
+AuthenticationMiddleware loads request.user lazily, but every request
+that does touch it costs a user query. With a shared cache
+(POLLS_SHARED_CACHE) CachedModelBackend serves get_user() from it;
+polls/signals.py drops the entry whenever the user is saved or deleted,
+which includes the last_login update at login and password changes.
+
+The password hash is never cached. The cached user leaves it deferred,
+so check_password() still loads it, and answers the session check with
+the session auth hash computed when it was cached.
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+
+def user_cache_key(user_id):
+    return f'polls:user:{user_id}'
+
+
+class CachedModelBackend(ModelBackend):
+    """ModelBackend whose get_user() is served from the cache"""
+
+    def get_user(self, user_id):
+        if not settings.POLLS_SHARED_CACHE:
+            return super().get_user(user_id)
+        key = user_cache_key(user_id)
+        cached = cache.get(key)
+        if cached is None:
+            user = super().get_user(user_id)
+            if user is not None:
+                cache.set(key, self.dump_user(user), timeout=settings.POLLS_USER_CACHE_TIMEOUT)
+        else:
+            user = self.load_user(cached)
+        return user if user is not None and self.user_can_authenticate(user) else None
+
+    def dump_user(self, user):
+        """What is cached of user: every field but the password, and its session auth hash"""
+        fields = {
+            field.attname: getattr(user, field.attname)
+            for field in user._meta.concrete_fields if field.attname != 'password'
+        }
+        return {'fields': fields, 'session_hash': user.get_session_auth_hash()}
+
+    def load_user(self, cached):
+        """Rebuild a user from dump_user(), with the password left deferred"""
+        fields = cached['fields']
+        user = get_user_model().from_db(DEFAULT_DB_ALIAS, list(fields), list(fields.values()))
+        session_hash = cached['session_hash']
+        user.get_session_auth_hash = lambda: session_hash
+        return user
+
+
+def forget_user(user_id):
+    """Drop the cached copy of a user"""
+    cache.delete(user_cache_key(user_id))
@@ -0,0 +1,249 @@
+"""
+Caching for the poll pages.
+
+The index question list is stored under a version key. Saving or deleting
+a Question or Choice bumps the version (see polls/signals.py), and every
+entry also expires at the next pub_date or end_date so scheduled
+questions appear and close on time.
+
+Whole pages are cached too. The results page of a closed question is
+kept under its results version, so it lives until the results change. The
+index page is cached for visitors without a session or messages cookie,
+who all get the same HTML, and is sent with Vary: Cookie.
+
+Hits and misses of the index question list and of each page are counted
+in the cache and exported on /metrics.
+
+The index question list is always filled from the primary database,
+never from a read replica that may lag behind the version it is stored
+under.
+"""
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Min
+from django.utils import timezone
+
+from django.utils.cache import patch_vary_headers
+
+from .models import Question
+from .pagination import encode_cursor
+from .routers import primary
+
+INDEX_VERSION_KEY = 'polls:index:version'
+INDEX_HITS_KEY = 'polls:index:hits'
+INDEX_MISSES_KEY = 'polls:index:misses'
+INDEX_SIZE = 5
+# Pages served through get_page(), by name
+PAGES = ('index', 'results')
+
+
+def _incr(key):
+    """Increment a counter, creating it if it was evicted"""
+    cache.add(key, 0, timeout=None)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, timeout=None)
+        return 1
+
+
+def index_version():
+    """Current version of the index cache"""
+    cache.add(INDEX_VERSION_KEY, 1, timeout=None)
+    return cache.get(INDEX_VERSION_KEY, 1)
+
+
+def bump_index_version():
+    """Invalidate every cached index entry"""
+    return _incr(INDEX_VERSION_KEY)
+
+
+def seconds_until_next_boundary(now=None):
+    """
+    Seconds until the next future pub_date or end_date, or None if no
+    question is scheduled to open or close.
+    """
+    now = now or timezone.now()
+    # Two separate aggregates so each one can be answered from its index
+    boundaries = [
+        Question.objects.filter(pub_date__gt=now).aggregate(Min('pub_date'))['pub_date__min'],
+        Question.objects.filter(end_date__gt=now).aggregate(Min('end_date'))['end_date__min'],
+    ]
+    return _seconds_until_first(now, boundaries)
+
+
+def _seconds_until_first(now, moments):
+    """Whole seconds from now until the earliest of moments, None if there are none"""
+    moments = [moment for moment in moments if moment is not None]
+    if not moments:
+        return None
+    return max(1, int((min(moments) - now).total_seconds()) + 1)
+
+
+def index_queryset(now):
+    """The questions listed on the index page, plus the next one if there is a next page"""
+    return Question.objects.filter(pub_date__lte=now).order_by('-pub_date', '-pk')[:INDEX_SIZE + 1]
+
+
+def first_index_page(questions):
+    """The questions shown from index_queryset() and the cursor of the next page, or None"""
+    next_cursor = encode_cursor(questions[INDEX_SIZE - 1]) if len(questions) > INDEX_SIZE else None
+    return questions[:INDEX_SIZE], next_cursor
+
+
+def index_timeout(boundary):
+    """Cache timeout for an index entry, cut short at the next boundary"""
+    timeout = settings.POLLS_INDEX_CACHE_TIMEOUT
+    if boundary is not None:
+        timeout = min(timeout, boundary)
+    return timeout
+
+
+def get_index_questions():
+    """index_queryset(), served from the cache when possible"""
+    key = f'polls:index:{index_version()}'
+    questions = cache.get(key)
+    if questions is not None:
+        _incr(INDEX_HITS_KEY)
+        return questions
+    _incr(INDEX_MISSES_KEY)
+    now = timezone.now()
+    # a lagging replica must not be cached until the next version bump
+    with primary():
+        questions = list(index_queryset(now))
+        timeout = index_timeout(seconds_until_next_boundary(now))
+    cache.set(key, questions, timeout=timeout)
+    return questions
+
+
+async def _aincr(key):
+    await cache.aadd(key, 0, timeout=None)
+    try:
+        return await cache.aincr(key)
+    except ValueError:
+        await cache.aset(key, 1, timeout=None)
+        return 1
+
+
+async def aget_index_questions():
+    """Async version of get_index_questions() for the ASGI views"""
+    await cache.aadd(INDEX_VERSION_KEY, 1, timeout=None)
+    key = f'polls:index:{await cache.aget(INDEX_VERSION_KEY, 1)}'
+    questions = await cache.aget(key)
+    if questions is not None:
+        await _aincr(INDEX_HITS_KEY)
+        return questions
+    await _aincr(INDEX_MISSES_KEY)
+    now = timezone.now()
+    with primary():
+        questions = [question async for question in index_queryset(now)]
+        next_pub = await Question.objects.filter(pub_date__gt=now).aaggregate(Min('pub_date'))
+        next_end = await Question.objects.filter(end_date__gt=now).aaggregate(Min('end_date'))
+    boundary = _seconds_until_first(now, [next_pub['pub_date__min'], next_end['end_date__min']])
+    await cache.aset(key, questions, timeout=index_timeout(boundary))
+    return questions
+
+
+def index_cache_stats():
+    """Hit and miss counters of the index cache, for monitoring"""
+    return {
+        'version': index_version(),
+        'hits': cache.get(INDEX_HITS_KEY, 0),
+        'misses': cache.get(INDEX_MISSES_KEY, 0),
+    }
+
+
+def page_stats_key(name, outcome):
+    return f'polls:page-stats:{name}:{outcome}'
+
+
+def page_cache_stats():
+    """Hit and miss counters of every cached page, by page name"""
+    keys = {(name, outcome): page_stats_key(name, outcome) for name in PAGES for outcome in ('hits', 'misses')}
+    counts = cache.get_many(keys.values())
+    return {
+        name: {outcome: counts.get(keys[name, outcome], 0) for outcome in ('hits', 'misses')}
+        for name in PAGES
+    }
+
+
+def get_page(name, page):
+    """Cached response of page, a (key, timeout) pair or None, counted as a hit or miss of name"""
+    if page is None:
+        return None
+    response = cache.get(page[0])
+    _incr(page_stats_key(name, 'misses' if response is None else 'hits'))
+    return response
+
+
+async def aget_page(name, page):
+    """Async version of get_page()"""
+    if page is None:
+        return None
+    response = await cache.aget(page[0])
+    await _aincr(page_stats_key(name, 'misses' if response is None else 'hits'))
+    return response
+
+
+def is_anonymous_request(request):
+    """True if the request carries neither a session nor queued messages"""
+    return (
+        request.method in ('GET', 'HEAD')
+        and settings.SESSION_COOKIE_NAME not in request.COOKIES
+        and 'messages' not in request.COOKIES
+    )
+
+
+def index_page_key(request):
+    """(key, timeout) of the anonymous unfiltered index page, None if it must not be shared"""
+    if not is_anonymous_request(request) or request.GET:
+        return None
+    return f'polls:page:index:{index_version()}', index_page_timeout
+
+
+def index_page_timeout():
+    """Cache timeout for the index page, cut short at the next boundary"""
+    return min(settings.POLLS_INDEX_PAGE_CACHE_TIMEOUT, index_timeout(seconds_until_next_boundary()))
+
+
+def closed_results_page_key(question):
+    """(key, timeout) of the results page of question, None while it is still open"""
+    if question.end_date is None or question.end_date >= timezone.now():
+        return None
+    return f'polls:page:results:{question.pk}:{question.results_version}', None
+
+
+def store_page(key, timeout, response):
+    """
+    Cache a rendered 200 response that sets no cookie. timeout may be a
+    callable, only called when the response is stored.
+    """
+    if response.status_code != 200 or response.cookies or response.streaming:
+        return
+    if hasattr(response, 'render'):
+        response.render()
+    cache.set(key, response, timeout=timeout() if callable(timeout) else timeout)
+
+
+def cache_page_by(name, key_func, vary_on_cookie=False):
+    """
+    Serve a view from the page cache under the key returned by
+    key_func(request); the view runs when it returns None or on a miss.
+    Hits and misses are counted under name.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            page = key_func(request)
+            response = get_page(name, page)
+            if response is None:
+                response = view(request, *args, **kwargs)
+                if page:
+                    store_page(*page, response)
+            if vary_on_cookie:
+                patch_vary_headers(response, ('Cookie',))
+            return response
+        return wrapper
+    return decorator
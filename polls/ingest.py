@@ -0,0 +1,254 @@
+"""
+Write-behind vote ingestion.
+
+When ``POLLS_VOTE_INGEST`` is on, the vote view only validates the choice
+and appends ``(user_id, choice_id)`` to a queue. A background flusher
+applies the queue in batches through ``Vote.objects.bulk_cast``, so a burst
+of POSTs costs one transaction per batch instead of one per vote.
+"""
+import atexit
+import json
+import logging
+import os
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+from .models import Vote
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryVoteQueue:
+    """Queue of pending votes kept in this process"""
+
+    def __init__(self):
+        self._items = deque()
+        self._lock = threading.Lock()
+
+    def put(self, user_id, choice_id):
+        """Append one vote"""
+        with self._lock:
+            self._items.append((user_id, choice_id))
+
+    @contextmanager
+    def claim(self, limit):
+        """
+        Yield up to limit votes, oldest first. They leave the queue only
+        when the block finishes without an error.
+        """
+        with self._lock:
+            batch = [self._items[n] for n in range(min(limit, len(self._items)))]
+        yield batch
+        # puts only append, so the claimed votes are still the oldest ones
+        with self._lock:
+            for _ in batch:
+                self._items.popleft()
+
+    def __len__(self):
+        return len(self._items)
+
+
+class FileVoteQueue:
+    """
+    Queue of pending votes appended to a local JSON lines file.
+
+    The file can be shared by several worker processes on one host.
+    Appends only lock it for the write. Applied votes are skipped rather
+    than cut out: the byte offset of the oldest pending vote is kept in
+    ``<path>.offset`` and only moved once a batch commits, so a crash or a
+    failed batch leaves the votes queued. Claims take their own lock,
+    ``<path>.claim``, so two flushers never apply the same votes and a
+    flush never holds up an append. The file is emptied whenever every
+    vote in it has been applied.
+    """
+
+    def __init__(self, path):
+        self.path = os.fspath(path)
+        self.offset_path = self.path + '.offset'
+        self.claim_path = self.path + '.claim'
+        self._lock = threading.Lock()
+        self._claim_lock = threading.Lock()
+
+    def _locked(self, path, mode):
+        handle = open(path, mode)
+        if fcntl is not None:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+        return handle
+
+    def put(self, user_id, choice_id):
+        """Append one vote"""
+        with self._lock, self._locked(self.path, 'ab') as handle:
+            handle.write(json.dumps([user_id, choice_id]).encode() + b'\n')
+
+    def _offset(self):
+        try:
+            with open(self.offset_path) as handle:
+                return int(handle.read() or 0)
+        except FileNotFoundError:
+            return 0
+
+    def _set_offset(self, offset):
+        temporary = self.offset_path + '.tmp'
+        with open(temporary, 'w') as handle:
+            handle.write(str(offset))
+        os.replace(temporary, self.offset_path)
+
+    def _pending(self, limit=None):
+        """(lines, end offset) of up to limit complete lines after the offset"""
+        offset = end = self._offset()
+        lines = []
+        try:
+            with open(self.path, 'rb') as handle:
+                if offset > os.fstat(handle.fileno()).st_size:
+                    # the file was emptied but the offset not yet reset
+                    offset = end = 0
+                handle.seek(offset)
+                while limit is None or len(lines) < limit:
+                    line = handle.readline()
+                    # a line still being appended is left for the next claim
+                    if not line.endswith(b'\n'):
+                        break
+                    lines.append(line)
+                    end += len(line)
+        except FileNotFoundError:
+            pass
+        return lines, end
+
+    @contextmanager
+    def claim(self, limit):
+        """
+        Yield up to limit votes, oldest first. They leave the queue only
+        when the block finishes without an error.
+        """
+        with self._claim_lock, self._locked(self.claim_path, 'a'):
+            lines, end = self._pending(limit)
+            yield [tuple(json.loads(line)) for line in lines]
+            if lines:
+                self._advance(end)
+
+    def _advance(self, end):
+        """Skip the votes before end, emptying the file if nothing is left"""
+        with self._lock, self._locked(self.path, 'ab') as handle:
+            if end < os.fstat(handle.fileno()).st_size:
+                self._set_offset(end)
+            else:
+                # reset first: a crash in between replays applied votes rather than skipping new ones
+                self._set_offset(0)
+                handle.truncate(0)
+
+    def __len__(self):
+        return len(self._pending()[0])
+
+
+class VoteIngestor:
+    """Drain a vote queue into the database in batches"""
+
+    def __init__(self, queue, flush_interval=1.0, batch_size=500):
+        self.queue = queue
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._flush_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def submit(self, user_id, choice_id):
+        """Queue a vote and make sure the background flusher is running"""
+        self.queue.put(user_id, choice_id)
+        if self.flush_interval > 0 and self._thread is None:
+            self.start()
+
+    def start(self):
+        """Start the background flusher thread"""
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name='polls-vote-flusher', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        try:
+            while not self._stopped.wait(self.flush_interval):
+                try:
+                    self.flush()
+                except Exception:
+                    logger.exception("Flushing queued votes failed")
+        finally:
+            connection.close()
+
+    def flush(self):
+        """
+        Apply every queued vote, one transaction per batch. Returns the
+        number applied. A batch that fails stays queued for the next flush.
+        """
+        applied = 0
+        with self._flush_lock:
+            while True:
+                with self.queue.claim(self.batch_size) as batch:
+                    if not batch:
+                        return applied
+                    applied += Vote.objects.bulk_cast(batch)
+
+    def stop(self, drain=True):
+        """Stop the flusher and, unless drain is False, apply what is still queued"""
+        self._stopped.set()
+        thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join()
+        if drain:
+            self.flush()
+
+
+_ingestor = None
+_ingestor_lock = threading.Lock()
+
+
+def is_enabled():
+    """True if votes should go through the ingestion queue"""
+    return settings.POLLS_VOTE_INGEST
+
+
+def get_ingestor():
+    """Return the process-wide ingestor built from the settings"""
+    global _ingestor
+    with _ingestor_lock:
+        if _ingestor is None:
+            if settings.POLLS_VOTE_QUEUE_PATH:
+                queue = FileVoteQueue(settings.POLLS_VOTE_QUEUE_PATH)
+            else:
+                queue = MemoryVoteQueue()
+            _ingestor = VoteIngestor(
+                queue,
+                flush_interval=settings.POLLS_VOTE_FLUSH_INTERVAL,
+                batch_size=settings.POLLS_VOTE_BATCH_SIZE,
+            )
+        return _ingestor
+
+
+@atexit.register
+def drain():
+    """Apply any votes still queued when the process shuts down"""
+    global _ingestor
+    with _ingestor_lock:
+        ingestor, _ingestor = _ingestor, None
+    if ingestor is not None:
+        ingestor.stop(drain=True)
+
+
+def reset_ingestor():
+    """Stop the ingestor without applying its queue, the next get_ingestor() reads the settings again"""
+    global _ingestor
+    with _ingestor_lock:
+        if _ingestor is not None:
+            _ingestor.stop(drain=False)
+        _ingestor = None
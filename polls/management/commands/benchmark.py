@@ -0,0 +1,57 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from benchmarks import load, test_database
+
+
+class Command(BaseCommand):
+    """Load test the poll pages on a throwaway database"""
+    help = (
+        "Seed a throwaway database, drive the index, detail, vote and results pages "
+        "with concurrent clients and report req/s, latency percentiles and queries "
+        "per request as JSON. With --baseline, fail on regressions."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--questions', type=int, default=100)
+        parser.add_argument('--choices', type=int, default=4)
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--votes-per-user', type=int, default=5)
+        parser.add_argument('--requests', type=int, default=400, help="Requests per scenario.")
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--scenarios', nargs='+', default=load.SCENARIOS, choices=load.SCENARIOS)
+        parser.add_argument('--seed', type=int, default=0, help="Random seed of the dataset and requests.")
+        parser.add_argument('-o', '--output', help="Also write the report to this file.")
+        parser.add_argument('--baseline', help="Report of an earlier run to compare with.")
+        parser.add_argument(
+            '--threshold', type=float, default=10,
+            help="Allowed regression against --baseline in percent (default 10).",
+        )
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline'], encoding='utf-8') as source:
+                baseline = json.load(source)
+        with test_database():
+            report = load.run(
+                questions=options['questions'],
+                choices=options['choices'],
+                users=options['users'],
+                votes_per_user=options['votes_per_user'],
+                requests=options['requests'],
+                concurrency=options['concurrency'],
+                scenarios=options['scenarios'],
+                random_seed=options['seed'],
+            )
+        text = json.dumps(report, indent=2)
+        self.stdout.write(text)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as target:
+                target.write(text + '\n')
+        if baseline is not None:
+            regressions = load.compare(report, baseline, options['threshold'])
+            if regressions:
+                raise CommandError("Performance regressed:\n" + "\n".join(regressions))
+            self.stdout.write(self.style.SUCCESS(f"No regression beyond {options['threshold']}%."))
@@ -0,0 +1,80 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.functions import TruncHour, TruncMinute
+from django.utils import timezone
+
+from polls.models import Vote, VoteBucket
+
+TRUNCATE = {VoteBucket.MINUTE: TruncMinute, VoteBucket.HOUR: TruncHour}
+
+
+class Command(BaseCommand):
+    """Prune or rebuild the per-minute/per-hour vote history buckets"""
+    help = (
+        "Drop minute vote history buckets older than a number of days (hour "
+        "buckets are kept) and, with --rebuild, rebuild the buckets from "
+        "Vote.cast_at. A rebuild replaces the incremental history: votes only "
+        "remember their latest choice, so the moves of earlier revotes are lost."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rebuild', action='store_true',
+            help="Replace the buckets with counts of the current votes, losing revote history.",
+        )
+        parser.add_argument(
+            '--question', type=int, action='append', dest='questions',
+            help="Only rebuild this question, may be repeated.",
+        )
+        parser.add_argument(
+            '--prune-minutes', type=int, metavar='DAYS',
+            help="Delete minute buckets older than DAYS days.",
+        )
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        if not options['rebuild'] and options['prune_minutes'] is None:
+            raise CommandError("Nothing to do, pass --prune-minutes and/or --rebuild.")
+        if options['rebuild']:
+            self.rebuild(options['questions'], options['batch_size'])
+        if options['prune_minutes'] is not None:
+            cutoff = timezone.now() - datetime.timedelta(days=options['prune_minutes'])
+            deleted, _ = VoteBucket.objects.filter(resolution=VoteBucket.MINUTE, start__lt=cutoff).delete()
+            self.stdout.write(f"Pruned {deleted} minute bucket(s).")
+
+    def rebuild(self, questions, batch_size):
+        """
+        Replace the buckets with counts of the current votes by cast time.
+
+        Vote rows only remember their latest choice, so moves made by
+        earlier revotes are lost; incremental buckets keep them.
+        """
+        votes = Vote.objects.all()
+        buckets = VoteBucket.objects.all()
+        if questions:
+            votes = votes.filter(question__in=questions)
+            buckets = buckets.filter(question__in=questions)
+        created = 0
+        with transaction.atomic():
+            buckets.delete()
+            for resolution, truncate in TRUNCATE.items():
+                rows = (
+                    votes.annotate(start=truncate('cast_at', tzinfo=datetime.timezone.utc))
+                    .values('question', 'choice', 'start')
+                    .annotate(total=Count('id'))
+                    .order_by()
+                )
+                batch = []
+                for row in rows.iterator(chunk_size=batch_size):
+                    batch.append(VoteBucket(
+                        question_id=row['question'], choice_id=row['choice'],
+                        resolution=resolution, start=row['start'], count=row['total'],
+                    ))
+                    if len(batch) >= batch_size:
+                        created += len(VoteBucket.objects.bulk_create(batch))
+                        batch = []
+                created += len(VoteBucket.objects.bulk_create(batch))
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {created} bucket(s)."))
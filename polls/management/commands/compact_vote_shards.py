@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from polls.models import VoteShard
+
+
+class Command(BaseCommand):
+    """Fold the sharded vote counters back into Choice.vote_count"""
+    help = (
+        "Add the counts of every vote shard to the vote_count of its choice and "
+        "reset the shards to zero. With --loop, keep running every --interval seconds."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--question', type=int, action='append', dest='questions',
+            help="Only compact the choices of this question, may be repeated.",
+        )
+        parser.add_argument('--loop', action='store_true', help="Run until interrupted.")
+        parser.add_argument(
+            '--interval', type=float, default=60,
+            help="Seconds between two runs of --loop (default 60).",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            folded = VoteShard.objects.compact(options['questions'])
+            self.stdout.write(f"Folded {folded} vote shard(s).")
+            if not options['loop']:
+                return
+            close_old_connections()
+            time.sleep(options['interval'])
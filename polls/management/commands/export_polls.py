@@ -0,0 +1,70 @@
+import datetime
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F
+
+from polls.models import Choice, Question, Vote
+
+# Exported in dependency order so import_polls can insert them as they come
+EXPORT_MODELS = [User, Question, Choice, Vote]
+
+
+class ExportEncoder(DjangoJSONEncoder):
+    """DjangoJSONEncoder that keeps the microseconds of datetimes"""
+
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def concrete_fields(model):
+    """Field names and column attributes written for model, primary key excluded"""
+    return [(field.name, field.attname) for field in model._meta.concrete_fields if not field.primary_key]
+
+
+class Command(BaseCommand):
+    """Stream users, questions, choices and votes as JSON lines"""
+    help = "Export polls data as JSON lines, one object per line, in constant memory."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '-o', '--output', default='-',
+            help="File to write to, '-' (default) for standard output.",
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=2000,
+            help="Rows fetched from the database at a time.",
+        )
+
+    def handle(self, *args, **options):
+        if options['output'] == '-':
+            self.export(self.stdout.write, options['chunk_size'])
+        else:
+            with open(options['output'], 'w', encoding='utf-8') as out:
+                self.export(lambda line: out.write(line + '\n'), options['chunk_size'])
+
+    def export(self, write, chunk_size):
+        encoder = ExportEncoder(ensure_ascii=False)
+        for model in EXPORT_MODELS:
+            label = model._meta.label_lower
+            fields = concrete_fields(model)
+            columns = [attname for _, attname in fields]
+            queryset = model.objects.order_by('pk')
+            if model is Choice:
+                # shards are not exported, their votes go out in vote_count
+                queryset = queryset.with_votes()
+                columns = [F('vote_count') + F('shard_votes') if column == 'vote_count' else column for column in columns]
+            rows = queryset.values_list('pk', *columns)
+            count = 0
+            for pk, *values in rows.iterator(chunk_size=chunk_size):
+                record = {
+                    'model': label,
+                    'pk': pk,
+                    'fields': {name: value for (name, _), value in zip(fields, values)},
+                }
+                write(encoder.encode(record))
+                count += 1
+            self.stderr.write(f"Exported {count} {label} object(s).")
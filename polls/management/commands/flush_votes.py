@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from polls import ingest
+
+
+class Command(BaseCommand):
+    """Apply votes waiting in the ingestion queue"""
+    help = "Apply every vote waiting in the write-behind ingestion queue."
+
+    def handle(self, *args, **options):
+        applied = ingest.get_ingestor().flush()
+        self.stdout.write(self.style.SUCCESS(f"Applied {applied} vote(s)."))
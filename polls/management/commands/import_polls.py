@@ -0,0 +1,93 @@
+import json
+import sys
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+
+from polls.cache import bump_index_version
+from polls.models import Question
+
+from .export_polls import EXPORT_MODELS
+
+
+class Command(BaseCommand):
+    """Load JSON lines written by export_polls in bulk, chunk by chunk"""
+    help = (
+        "Import polls data from JSON lines in constant memory. "
+        "Objects are inserted with bulk_create, one transaction per chunk."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('input', help="JSON lines file, '-' for standard input.")
+        parser.add_argument(
+            '--chunk-size', type=int, default=2000,
+            help="Objects inserted per bulk_create and transaction.",
+        )
+        parser.add_argument(
+            '--ignore-conflicts', action='store_true',
+            help="Skip objects whose primary key or unique fields already exist.",
+        )
+
+    def handle(self, *args, **options):
+        self.chunk_size = options['chunk_size']
+        self.ignore_conflicts = options['ignore_conflicts']
+        self.counts = {}
+        if options['input'] == '-':
+            self.load(sys.stdin)
+        else:
+            with open(options['input'], encoding='utf-8') as source:
+                self.load(source)
+        self.reset_sequences()
+        # exported states may be out of date by now
+        Question.objects.update_states()
+        # bulk_create sends no post_save signals, drop the cached index here
+        bump_index_version()
+        for label, count in self.counts.items():
+            self.stdout.write(f"Imported {count} {label} object(s).")
+
+    def load(self, lines):
+        allowed = {model._meta.label_lower for model in EXPORT_MODELS}
+        model, pending = None, []
+        for number, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                label = record['model']
+            except (ValueError, KeyError, TypeError) as exc:
+                raise CommandError(f"Line {number}: not an exported object ({exc})")
+            if label not in allowed:
+                raise CommandError(f"Line {number}: unexpected model {label!r}")
+            record_model = apps.get_model(label)
+            if record_model is not model or len(pending) >= self.chunk_size:
+                self.flush(model, pending)
+                model, pending = record_model, []
+            pending.append(self.build(model, record))
+        self.flush(model, pending)
+
+    @staticmethod
+    def build(model, record):
+        """Model instance for one exported record, foreign keys set by id"""
+        instance = model(pk=record['pk'])
+        for name, value in record['fields'].items():
+            field = model._meta.get_field(name)
+            setattr(instance, field.attname, field.to_python(value))
+        return instance
+
+    def flush(self, model, objects):
+        if not objects:
+            return
+        with transaction.atomic():
+            model.objects.bulk_create(objects, ignore_conflicts=self.ignore_conflicts)
+        label = model._meta.label_lower
+        self.counts[label] = self.counts.get(label, 0) + len(objects)
+
+    def reset_sequences(self):
+        """Move auto-increment sequences past the imported primary keys"""
+        statements = connection.ops.sequence_reset_sql(no_style(), EXPORT_MODELS)
+        if statements:
+            with connection.cursor() as cursor:
+                for sql in statements:
+                    cursor.execute(sql)
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from polls.models import Choice, Vote, VoteShard, notify_votes_recorded
+
+
+class Command(BaseCommand):
+    """Rebuild Choice.vote_count from Vote rows, folding in the shards, and report any drift"""
+    help = "Rebuild the stored vote tally of every choice from the Vote table."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help="Only report drift, do not write the corrected counts.",
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            if not options['dry_run']:
+                # the stored tally is vote_count alone once the shards are folded into it
+                VoteShard.objects.compact()
+            actual = dict(
+                Vote.objects.values_list('choice').annotate(total=Count('id')).order_by()
+            )
+            drifted = []
+            choices = Choice.objects.select_for_update().with_votes().only('id', 'question_id', 'vote_count')
+            for choice in choices.iterator():
+                expected = actual.get(choice.pk, 0)
+                if choice.votes != expected:
+                    self.stdout.write(
+                        f"choice {choice.pk}: stored {choice.votes}, counted {expected}"
+                    )
+                    choice.vote_count = expected
+                    drifted.append(choice)
+            if drifted and not options['dry_run']:
+                Choice.objects.bulk_update(drifted, ['vote_count'], batch_size=500)
+                notify_votes_recorded({choice.question_id for choice in drifted})
+        if not drifted:
+            self.stdout.write(self.style.SUCCESS("All vote counts are consistent."))
+        elif options['dry_run']:
+            self.stdout.write(self.style.WARNING(f"{len(drifted)} choice(s) drifted."))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Fixed {len(drifted)} choice(s)."))
@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from polls.cache import bump_index_version, seconds_until_next_boundary
+from polls.models import Question
+
+
+class Command(BaseCommand):
+    """Move questions between upcoming, open and closed as their dates pass"""
+    help = (
+        "Update Question.state for every question whose pub_date or end_date "
+        "has passed. With --loop, keep running and wake up at each boundary."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--loop', action='store_true',
+            help="Run until interrupted, sleeping until the next pub_date or end_date.",
+        )
+        parser.add_argument(
+            '--interval', type=float, default=60,
+            help="Longest sleep in seconds between two runs of --loop (default 60).",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            changed = Question.objects.update_states()
+            if changed:
+                bump_index_version()
+            self.stdout.write(f"Updated the state of {changed} question(s).")
+            if not options['loop']:
+                return
+            close_old_connections()
+            wait = seconds_until_next_boundary()
+            time.sleep(options['interval'] if wait is None else min(wait, options['interval']))
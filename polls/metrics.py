@@ -0,0 +1,152 @@
+"""
+Per-view request and query metrics in Prometheus text format.
+
+``MetricsMiddleware`` samples POLLS_METRICS_SAMPLE_RATE of the requests.
+For a sampled request it times the response and wraps every database
+connection to count queries and their time. Requests that are not
+sampled only cost one random() call. Queries whose fingerprint runs
+more than once in the same request are counted per view, so N+1
+patterns stand out at the top of ``/metrics``.
+"""
+import re
+import threading
+from collections import Counter, defaultdict
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+# Repeated query fingerprints exported per view
+TOP_QUERIES = 10
+# Fingerprints kept per view before the rarest are dropped
+MAX_FINGERPRINTS = 200
+
+_IN_LIST = re.compile(r'\bIN \((?:%s, )*%s\)')
+_NUMBER = re.compile(r'\b\d+\b')
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_SPACES = re.compile(r'\s+')
+
+
+def fingerprint(sql):
+    """SQL with literals and IN lists collapsed, so repeats of one query compare equal"""
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _IN_LIST.sub('IN (...)', sql)
+    return _SPACES.sub(' ', sql).strip()
+
+
+class QueryRecorder:
+    """Execute wrapper counting the queries and database time of one request"""
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.count = 0
+        self.seconds = 0.0
+        self.fingerprints = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = self.clock()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += self.clock() - start
+            self.count += 1
+            self.fingerprints[fingerprint(sql)] += 1
+
+
+class ViewMetrics:
+    """Running totals of one view"""
+
+    def __init__(self):
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+        self.requests = 0
+        self.seconds = 0.0
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.repeated = Counter()
+
+    def add(self, seconds, recorder):
+        for index, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                self.buckets[index] += 1
+        self.requests += 1
+        self.seconds += seconds
+        self.queries += recorder.count
+        self.db_seconds += recorder.seconds
+        for sql, count in recorder.fingerprints.items():
+            if count > 1:
+                self.repeated[sql] += count
+        if len(self.repeated) > MAX_FINGERPRINTS:
+            self.repeated = Counter(dict(self.repeated.most_common(MAX_FINGERPRINTS // 2)))
+
+
+class MetricsRegistry:
+    """Metrics of every view, safe to update from several threads"""
+
+    def __init__(self):
+        self._views = defaultdict(ViewMetrics)
+        self._lock = threading.Lock()
+
+    def record(self, view, seconds, recorder):
+        with self._lock:
+            self._views[view].add(seconds, recorder)
+
+    def reset(self):
+        with self._lock:
+            self._views.clear()
+
+    def render(self, sample_rate, caches=None):
+        """
+        The metrics in the Prometheus text exposition format. caches maps
+        cache names to their {'hits': n, 'misses': n} counters.
+        """
+        lines = [
+            '# HELP polls_metrics_sample_rate Fraction of requests that are measured.',
+            '# TYPE polls_metrics_sample_rate gauge',
+            f'polls_metrics_sample_rate {sample_rate}',
+            '# HELP polls_request_duration_seconds Latency of sampled requests by view.',
+            '# TYPE polls_request_duration_seconds histogram',
+        ]
+        with self._lock:
+            views = sorted(self._views.items())
+            for view, metrics in views:
+                name = escape(view)
+                for bound, count in zip(LATENCY_BUCKETS, metrics.buckets):
+                    lines.append(f'polls_request_duration_seconds_bucket{{view="{name}",le="{bound}"}} {count}')
+                lines.append(f'polls_request_duration_seconds_bucket{{view="{name}",le="+Inf"}} {metrics.requests}')
+                lines.append(f'polls_request_duration_seconds_sum{{view="{name}"}} {metrics.seconds:.6f}')
+                lines.append(f'polls_request_duration_seconds_count{{view="{name}"}} {metrics.requests}')
+            lines += [
+                '# HELP polls_db_queries_total Queries run by sampled requests by view.',
+                '# TYPE polls_db_queries_total counter',
+            ]
+            lines += [f'polls_db_queries_total{{view="{escape(view)}"}} {m.queries}' for view, m in views]
+            lines += [
+                '# HELP polls_db_duration_seconds_total Database time of sampled requests by view.',
+                '# TYPE polls_db_duration_seconds_total counter',
+            ]
+            lines += [f'polls_db_duration_seconds_total{{view="{escape(view)}"}} {m.db_seconds:.6f}' for view, m in views]
+            lines += [
+                '# HELP polls_repeated_queries_total Queries run more than once in one request, by fingerprint.',
+                '# TYPE polls_repeated_queries_total counter',
+            ]
+            for view, metrics in views:
+                for sql, count in metrics.repeated.most_common(TOP_QUERIES):
+                    lines.append(
+                        f'polls_repeated_queries_total{{view="{escape(view)}",query="{escape(sql)}"}} {count}'
+                    )
+        for outcome in ('hits', 'misses'):
+            lines += [
+                f'# HELP polls_cache_{outcome}_total Cache {outcome} of the poll index and pages, by cache.',
+                f'# TYPE polls_cache_{outcome}_total counter',
+            ]
+            lines += [
+                f'polls_cache_{outcome}_total{{cache="{escape(name)}"}} {counts[outcome]}'
+                for name, counts in sorted((caches or {}).items())
+            ]
+        return '\n'.join(lines) + '\n'
+
+
+def escape(value):
+    """Escape a Prometheus label value"""
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+registry = MetricsRegistry()
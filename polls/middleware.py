@@ -0,0 +1,214 @@
+"""
+Middleware of the polls app.
+
+The detail and vote views need the same question, choices and vote in
+more than one place. ``RequestCacheMiddleware`` gives every request an
+empty ``RequestCache``; ``memoize`` loads a value at most once per
+request and nothing outlives the response.
+
+``MetricsMiddleware`` feeds the per-view metrics of polls.metrics and
+``RateLimitMiddleware`` enforces POLLS_RATE_LIMITS, see polls.ratelimit.
+``ReplicaRoutingMiddleware`` picks the database reads go to, see
+polls.routers.
+"""
+import random
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.utils.decorators import sync_and_async_middleware
+
+from . import ratelimit, routers
+from .metrics import QueryRecorder, registry
+
+
+class RequestCache(dict):
+    """Values loaded during one request, by key"""
+
+    def get_or_load(self, key, load):
+        """Return the value stored under key, calling load() the first time"""
+        try:
+            return self[key]
+        except KeyError:
+            value = self[key] = load()
+            return value
+
+
+def get_request_cache(request):
+    """The cache of request, created on first use if the middleware is not installed"""
+    try:
+        return request.polls_cache
+    except AttributeError:
+        request.polls_cache = RequestCache()
+        return request.polls_cache
+
+
+def memoize(request, key, load):
+    """Shortcut for get_request_cache(request).get_or_load(key, load)"""
+    return get_request_cache(request).get_or_load(key, load)
+
+
+@sync_and_async_middleware
+def RequestCacheMiddleware(get_response):
+    """Give each request a fresh RequestCache and drop it with the response"""
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            request.polls_cache = RequestCache()
+            try:
+                return await get_response(request)
+            finally:
+                request.polls_cache.clear()
+    else:
+        def middleware(request):
+            request.polls_cache = RequestCache()
+            try:
+                return get_response(request)
+            finally:
+                request.polls_cache.clear()
+    return middleware
+
+
+@sync_and_async_middleware
+class MetricsMiddleware:
+    """Record latency and queries of a sample of requests by URL name"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not self.sampled():
+            return self.get_response(request)
+        recorder = QueryRecorder(time.perf_counter)
+        start = time.perf_counter()
+        with recording(recorder):
+            response = self.get_response(request)
+        self.record(request, start, recorder)
+        return response
+
+    async def __acall__(self, request):
+        if not self.sampled():
+            return await self.get_response(request)
+        recorder = QueryRecorder(time.perf_counter)
+        start = time.perf_counter()
+        with recording(recorder):
+            response = await self.get_response(request)
+        self.record(request, start, recorder)
+        return response
+
+    def sampled(self):
+        rate = settings.POLLS_METRICS_SAMPLE_RATE
+        return rate >= 1 or (rate > 0 and random.random() < rate)
+
+    def record(self, request, start, recorder):
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match is not None else 'unresolved'
+        registry.record(view, time.perf_counter() - start, recorder)
+
+
+@contextmanager
+def recording(recorder):
+    """
+    Run recorder around the queries of every connection inside the block.
+    Unlike connection.execute_wrapper() it is removed by identity, so a
+    wrapper another caller adds meanwhile is left in place.
+    """
+    wrapped = list(connections.all())
+    for connection in wrapped:
+        connection.execute_wrappers.append(recorder)
+    try:
+        yield
+    finally:
+        for connection in wrapped:
+            connection.execute_wrappers.remove(recorder)
+
+
+@sync_and_async_middleware
+class RateLimitMiddleware:
+    """Answer 429 to requests over the rate of their URL name, before the view runs"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        response = self.get_response(request)
+        self.remember_user(request)
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        self.remember_user(request)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not settings.POLLS_RATE_LIMIT_ENABLED:
+            return None
+        name = request.resolver_match.view_name
+        rate = settings.POLLS_RATE_LIMITS.get(name)
+        if rate is None:
+            return None
+        request.rate_limit = (name, rate)
+        return ratelimit.check(request, name, rate)
+
+    def remember_user(self, request):
+        """After a limited view, note the user of its session for the next check"""
+        rate_limit = getattr(request, 'rate_limit', None)
+        if rate_limit is not None:
+            ratelimit.remember_request_user(request, *rate_limit)
+
+
+@sync_and_async_middleware
+class ReplicaRoutingMiddleware:
+    """Read from the replica in the views of POLLS_REPLICA_VIEWS, stick to the primary after a write"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        token = routers.read_alias.set(None)
+        try:
+            response = self.get_response(request)
+        finally:
+            routers.read_alias.reset(token)
+        return self.stick(request, response)
+
+    async def __acall__(self, request):
+        token = routers.read_alias.set(None)
+        try:
+            response = await self.get_response(request)
+        finally:
+            routers.read_alias.reset(token)
+        return self.stick(request, response)
+
+    def stick(self, request, response):
+        """Send the sticky cookie with the response to a successful write"""
+        if (
+            settings.POLLS_REPLICA_DATABASE
+            and request.method not in ('GET', 'HEAD', 'OPTIONS')
+            and response.status_code < 400
+        ):
+            response.set_cookie(
+                routers.STICKY_COOKIE, '1', max_age=settings.POLLS_REPLICA_STICKY_SECONDS,
+                httponly=True, samesite='Lax',
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        routers.read_alias.set(routers.replica_for(request))
+        return None
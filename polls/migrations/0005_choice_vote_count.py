@@ -0,0 +1,27 @@
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_existing_votes(apps, schema_editor):
+    """Fill the new tally from the Vote rows that already exist"""
+    Choice = apps.get_model("polls", "Choice")
+    Vote = apps.get_model("polls", "Vote")
+    counts = Vote.objects.values("choice").annotate(total=Count("id"))
+    for row in counts:
+        Choice.objects.filter(pk=row["choice"]).update(vote_count=row["total"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("polls", "0004_alter_question_end_date"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="choice",
+            name="vote_count",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(count_existing_votes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,61 @@
+from django.db import migrations, models
+from django.db.models import Count, Max
+import django.db.models.deletion
+
+
+def fill_question_and_dedupe(apps, schema_editor):
+    """
+    Copy each vote's question from its choice, then keep only the latest
+    vote of every (user, question) pair and rebuild the tallies.
+    """
+    Choice = apps.get_model("polls", "Choice")
+    Vote = apps.get_model("polls", "Vote")
+    for choice in Choice.objects.only("id", "question_id").iterator():
+        Vote.objects.filter(choice_id=choice.pk).update(question_id=choice.question_id)
+    duplicates = (
+        Vote.objects.filter(user__isnull=False)
+        .values("user", "question")
+        .annotate(latest=Max("id"), total=Count("id"))
+        .filter(total__gt=1)
+    )
+    for row in duplicates:
+        Vote.objects.filter(user=row["user"], question=row["question"]).exclude(
+            id=row["latest"]
+        ).delete()
+    Choice.objects.update(vote_count=0)
+    counts = Vote.objects.values("choice").annotate(total=Count("id"))
+    for row in counts:
+        Choice.objects.filter(pk=row["choice"]).update(vote_count=row["total"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("polls", "0005_choice_vote_count"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="vote",
+            name="question",
+            field=models.ForeignKey(
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                to="polls.question",
+            ),
+        ),
+        migrations.RunPython(fill_question_and_dedupe, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="vote",
+            name="question",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE, to="polls.question"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="vote",
+            constraint=models.UniqueConstraint(
+                fields=("user", "question"), name="unique_vote_per_user_question"
+            ),
+        ),
+    ]
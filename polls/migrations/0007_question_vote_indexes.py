@@ -0,0 +1,25 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("polls", "0006_vote_question_unique_vote"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="question",
+            index=models.Index(fields=["pub_date"], name="question_pub_date_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="question",
+            index=models.Index(fields=["end_date"], name="question_end_date_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="vote",
+            index=models.Index(
+                fields=["question", "choice"], name="vote_question_choice_idx"
+            ),
+        ),
+    ]
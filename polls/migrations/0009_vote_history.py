@@ -0,0 +1,68 @@
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("polls", "0008_question_vote_version"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="vote",
+            name="cast_at",
+            field=models.DateTimeField(
+                default=django.utils.timezone.now, verbose_name="cast at"
+            ),
+        ),
+        migrations.CreateModel(
+            name="VoteBucket",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "resolution",
+                    models.CharField(
+                        choices=[("minute", "Minute"), ("hour", "Hour")], max_length=6
+                    ),
+                ),
+                ("start", models.DateTimeField()),
+                ("count", models.IntegerField(default=0)),
+                (
+                    "choice",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, to="polls.choice"
+                    ),
+                ),
+                (
+                    "question",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, to="polls.question"
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["question", "resolution", "start"],
+                        name="vote_bucket_range_idx",
+                    )
+                ],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="votebucket",
+            constraint=models.UniqueConstraint(
+                fields=("choice", "resolution", "start"), name="unique_vote_bucket"
+            ),
+        ),
+    ]
@@ -0,0 +1,40 @@
+from django.db import migrations, models
+from django.db.models import Q
+from django.utils import timezone
+
+
+def fill_states(apps, schema_editor):
+    """Set the state of every existing question from its dates"""
+    Question = apps.get_model("polls", "Question")
+    now = timezone.now()
+    Question.objects.filter(pub_date__lte=now).filter(
+        Q(end_date__isnull=True) | Q(end_date__gte=now)
+    ).update(state="open")
+    Question.objects.filter(pub_date__lte=now, end_date__lt=now).update(state="closed")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("polls", "0009_vote_history"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="question",
+            name="state",
+            field=models.CharField(
+                choices=[("upcoming", "Upcoming"), ("open", "Open"), ("closed", "Closed")],
+                default="upcoming",
+                editable=False,
+                max_length=8,
+            ),
+        ),
+        migrations.RunPython(fill_states, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="question",
+            index=models.Index(
+                fields=["state", "pub_date"], name="question_state_idx"
+            ),
+        ),
+    ]
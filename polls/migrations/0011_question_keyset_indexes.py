@@ -0,0 +1,31 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("polls", "0010_question_state"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="question",
+            name="question_pub_date_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="question",
+            name="question_state_idx",
+        ),
+        migrations.AddIndex(
+            model_name="question",
+            index=models.Index(
+                fields=["pub_date", "id"], name="question_pub_date_id_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="question",
+            index=models.Index(
+                fields=["state", "pub_date", "id"], name="question_state_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("polls", "0012_voteshard"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="voteshard",
+            name="version",
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
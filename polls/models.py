@@ -1,15 +1,69 @@
 import datetime
-from django.db import models
+import random
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import IntegrityError, models, transaction
+from django.db.models import Case, F, IntegerField, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.dispatch import Signal
 from django.utils import timezone
 from django.contrib import admin
 from django.contrib.auth.models import User
 
 
+class QuestionQuerySet(models.QuerySet):
+    """Queries on questions"""
+
+    def update_states(self, now=None):
+        """
+        Move every question whose pub_date or end_date has passed to its
+        current state, one UPDATE per target state. Returns the number of
+        questions changed.
+        """
+        now = now or timezone.now()
+        open_now = Q(pub_date__lte=now) & (Q(end_date__isnull=True) | Q(end_date__gte=now))
+        changed = self.filter(pub_date__gt=now).exclude(state=Question.UPCOMING).update(state=Question.UPCOMING)
+        changed += self.filter(open_now).exclude(state=Question.OPEN).update(state=Question.OPEN)
+        changed += self.filter(pub_date__lte=now, end_date__lt=now).exclude(state=Question.CLOSED).update(
+            state=Question.CLOSED,
+        )
+        return changed
+
+    def with_votes(self):
+        """Annotate total_votes, the compacted tallies of the choices plus their shards"""
+        return self.annotate(total_votes=Coalesce(Sum('choice__vote_count'), 0) + shard_total('question'))
+
+    def with_version(self):
+        """Annotate results_version, the vote_version plus the bumps still held by the vote shards"""
+        return self.annotate(results_version=F('vote_version') + shard_total('question', 'version'))
+
+
 class Question(models.Model):
     """Question text, publication date, and end date for questions"""
+    UPCOMING = 'upcoming'
+    OPEN = 'open'
+    CLOSED = 'closed'
+    STATES = [(UPCOMING, 'Upcoming'), (OPEN, 'Open'), (CLOSED, 'Closed')]
+
     question_text = models.CharField(max_length=200)
     pub_date = models.DateTimeField('date published')
     end_date = models.DateTimeField('end date', null=True, default=None)
+    # Kept in step with the dates by save() and the update_poll_states command
+    state = models.CharField(max_length=8, choices=STATES, default=UPCOMING, editable=False)
+    # Bumped whenever the results of the question change, used for ETags. With
+    # vote shards part of the bumps sit in the shards, see with_version()
+    vote_version = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = QuestionQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # keyset pagination of the index seeks on (pub_date, id)
+            models.Index(fields=['pub_date', 'id'], name='question_pub_date_id_idx'),
+            models.Index(fields=['end_date'], name='question_end_date_idx'),
+            models.Index(fields=['state', 'pub_date', 'id'], name='question_state_idx'),
+        ]
 
     @admin.display(
         boolean=True,
@@ -32,32 +86,423 @@ class Question(models.Model):
             return self.pub_date <= timezone.now()
         return self.pub_date <= timezone.now() <= self.end_date
 
+    def current_state(self, now=None):
+        """State of the question at now, computed from its dates"""
+        now = now or timezone.now()
+        if now < self.pub_date:
+            return self.UPCOMING
+        if self.end_date is not None and now > self.end_date:
+            return self.CLOSED
+        return self.OPEN
+
+    def save(self, *args, **kwargs):
+        """
+        Save the question with a fresh state but without writing
+        vote_version back. It only moves through F() updates, a stale
+        instance must not roll it back.
+        """
+        if self.pub_date is not None:
+            self.state = self.current_state()
+        if not self._state.adding and not args and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'vote_version'
+            ]
+        super().save(*args, **kwargs)
+
     def __str__(self):
         """Return question with text of question"""
         return self.question_text
 
 
+class ChoiceQuerySet(models.QuerySet):
+    """Queries on choices"""
+
+    def with_votes(self):
+        """Annotate shard_votes, the votes not yet compacted into vote_count"""
+        return self.annotate(shard_votes=shard_total('choice'))
+
+
 class Choice(models.Model):
     """Text of choice"""
     question = models.ForeignKey(Question, on_delete=models.CASCADE)
     choice_text = models.CharField(max_length=200)
-    # votes = models.IntegerField(default=0)
+    # Compacted tally, later votes are counted in the VoteShard rows of the choice
+    vote_count = models.IntegerField(default=0)
+
+    objects = ChoiceQuerySet.as_manager()
 
     @property
     def votes(self):
-        """Total vote"""
-        return Vote.objects.filter(choice=self).count()
+        """Total vote: the compacted tally plus its shards, annotated by with_votes() or summed once here"""
+        if getattr(self, 'shard_votes', None) is None:
+            self.shard_votes = self.voteshard_set.aggregate(total=Sum('count'))['total'] or 0
+        return self.vote_count + self.shard_votes
+
+    def refresh_from_db(self, *args, **kwargs):
+        """Reload the choice, its shards are summed again on the next votes"""
+        self.shard_votes = None
+        super().refresh_from_db(*args, **kwargs)
 
     def __str__(self):
         """Return text of choice"""
         return self.choice_text
 
 
+# Sent after the transaction that changed votes commits, with question_ids
+vote_recorded = Signal()
+
+
+def notify_votes_recorded(question_ids):
+    """
+    Bump the vote version of question_ids and send vote_recorded for them
+    once the current transaction commits.
+    """
+    question_ids = list(question_ids)
+    Question.objects.filter(pk__in=question_ids).update(vote_version=F('vote_version') + 1)
+    send_votes_recorded(question_ids)
+
+
+def send_votes_recorded(question_ids):
+    """Send vote_recorded for question_ids once the current transaction commits"""
+    question_ids = list(question_ids)
+    transaction.on_commit(lambda: vote_recorded.send(sender=Vote, question_ids=question_ids))
+
+
+def group_by_delta(deltas):
+    """Ids by the delta they get, so each distinct delta is one UPDATE"""
+    by_delta = defaultdict(list)
+    for choice_id, delta in deltas.items():
+        by_delta[delta].append(choice_id)
+    return by_delta
+
+
+def choice_delta(deltas, field='choice_id'):
+    """The delta of the row's choice, so all the choices of deltas take one UPDATE"""
+    return Case(
+        *[When(**{field: choice_id}, then=Value(delta)) for choice_id, delta in deltas.items()],
+        default=Value(0), output_field=IntegerField(),
+    )
+
+
+def apply_tally_deltas(deltas, choice_question, when):
+    """
+    Add per-choice vote deltas to the stored tallies and to the history
+    buckets of when, then announce the change. choice_question maps each
+    choice id to its question id. Runs inside the caller's transaction.
+
+    With POLLS_VOTE_SHARDS the deltas and the version bump go to a random
+    shard of each choice instead, and the history buckets are left to
+    compaction, see VoteShard.
+    """
+    deltas = {choice_id: delta for choice_id, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    question_ids = {choice_question[choice_id] for choice_id in deltas}
+    if settings.POLLS_VOTE_SHARDS:
+        VoteShard.objects.add(deltas, choice_question)
+        send_votes_recorded(question_ids)
+        return
+    Choice.objects.filter(pk__in=deltas).update(vote_count=F('vote_count') + choice_delta(deltas, 'pk'))
+    VoteBucket.objects.record(deltas, choice_question, when)
+    notify_votes_recorded(question_ids)
+
+
+class VoteManager(models.Manager):
+    """Manager that keeps Choice.vote_count in step with Vote rows"""
+
+    def cast(self, user, choice):
+        """
+        Record the vote of user for choice.
+
+        A first vote increments the tally of choice, a revote moves one
+        vote from the previously selected choice to the new one. The
+        unique (user, question) constraint decides between concurrent
+        first votes, the loser falls back to updating the winner's row.
+        """
+        now = timezone.now()
+        with transaction.atomic():
+            vote = self.select_for_update().filter(user=user, question_id=choice.question_id).first()
+            if vote is None:
+                try:
+                    with transaction.atomic():
+                        vote = self.create(user=user, question_id=choice.question_id, choice=choice, cast_at=now)
+                except IntegrityError:
+                    vote = self.select_for_update().get(user=user, question_id=choice.question_id)
+                else:
+                    apply_tally_deltas({choice.pk: 1}, {choice.pk: choice.question_id}, now)
+                    return vote
+            if vote.choice_id != choice.pk:
+                apply_tally_deltas(
+                    {vote.choice_id: -1, choice.pk: 1},
+                    {vote.choice_id: choice.question_id, choice.pk: choice.question_id},
+                    now,
+                )
+                vote.choice = choice
+                vote.cast_at = now
+                vote.save(update_fields=['choice', 'cast_at'])
+        return vote
+
+    def bulk_cast(self, entries, choice_question=None):
+        """
+        Apply many (user_id, choice_id) votes in one transaction.
+
+        Later entries for the same user and question win. Votes for
+        choices or users that no longer exist are dropped, so one stale
+        entry cannot fail the whole batch, unless the caller already
+        checked them and passes choice_question, the question id of every
+        choice. Returns the number of votes that were created or changed.
+
+        As in cast(), a first vote that loses to a concurrent one falls
+        back to updating the winner's row.
+        """
+        if choice_question is None:
+            choice_question = dict(
+                Choice.objects.filter(pk__in={choice_id for _, choice_id in entries})
+                .values_list('pk', 'question_id')
+            )
+            users = set(
+                User.objects.filter(pk__in={user_id for user_id, _ in entries if user_id is not None})
+                .values_list('pk', flat=True)
+            )
+            entries = [(user_id, choice_id) for user_id, choice_id in entries if user_id is None or user_id in users]
+        else:
+            choice_question = dict(choice_question)
+        latest = {}
+        for user_id, choice_id in entries:
+            if choice_id in choice_question:
+                latest[(user_id, choice_question[choice_id])] = choice_id
+        if not latest:
+            return 0
+        now = timezone.now()
+        with transaction.atomic():
+            try:
+                with transaction.atomic():
+                    created, changed, deltas = self.plan_bulk_cast(latest, choice_question, now)
+                    self.bulk_create(created)
+            except IntegrityError:
+                # concurrent first votes took some of the rows, lock them again and move them instead
+                created, changed, deltas = self.plan_bulk_cast(latest, choice_question, now)
+                self.bulk_create(created)
+            self.bulk_update(changed, ['choice', 'cast_at'])
+            apply_tally_deltas(deltas, choice_question, now)
+        return len(created) + len(changed)
+
+    def plan_bulk_cast(self, latest, choice_question, now):
+        """
+        Lock the current votes of a {(user_id, question_id): choice_id} map
+        and return the votes to create, the votes to change and the tally
+        deltas. Adds the previous choices of changed votes to choice_question.
+        """
+        existing = {
+            (vote.user_id, vote.question_id): vote
+            for vote in self.select_for_update().filter(
+                user_id__in={user_id for user_id, _ in latest},
+                question_id__in={question_id for _, question_id in latest},
+            )
+        }
+        created, changed, deltas = [], [], defaultdict(int)
+        for (user_id, question_id), choice_id in latest.items():
+            vote = existing.get((user_id, question_id))
+            if vote is None:
+                created.append(self.model(
+                    user_id=user_id, question_id=question_id, choice_id=choice_id, cast_at=now,
+                ))
+                deltas[choice_id] += 1
+            elif vote.choice_id != choice_id:
+                choice_question[vote.choice_id] = question_id
+                deltas[vote.choice_id] -= 1
+                deltas[choice_id] += 1
+                vote.choice_id = choice_id
+                vote.cast_at = now
+                changed.append(vote)
+        return created, changed, deltas
+
+
 class Vote(models.Model):
     """Model for voting"""
     user = models.ForeignKey(User, on_delete=models.CASCADE, null=True)
+    question = models.ForeignKey(Question, on_delete=models.CASCADE)
     choice = models.ForeignKey(Choice, on_delete=models.CASCADE)
+    cast_at = models.DateTimeField('cast at', default=timezone.now)
+
+    objects = VoteManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'question'], name='unique_vote_per_user_question'),
+        ]
+        indexes = [
+            models.Index(fields=['question', 'choice'], name='vote_question_choice_idx'),
+        ]
+
+    def __str__(self):
+        return f"user={self.user}, question={self.question}, choice={self.choice.choice_text}"
+
+
+class VoteBucketManager(models.Manager):
+    """Incremental maintenance of the vote history rollup"""
+
+    def record(self, deltas, choice_question, when):
+        """
+        Add per-choice deltas to the minute and hour buckets containing
+        when: one INSERT of the missing buckets, one UPDATE of them all.
+        """
+        if not deltas:
+            return
+        starts = {resolution: VoteBucket.bucket_start(when, resolution) for resolution in VoteBucket.RESOLUTIONS}
+        self.bulk_create(
+            [
+                VoteBucket(question_id=choice_question[choice_id], choice_id=choice_id,
+                           resolution=resolution, start=start)
+                for resolution, start in starts.items() for choice_id in deltas
+            ],
+            ignore_conflicts=True,
+        )
+        buckets = Q()
+        for resolution, start in starts.items():
+            buckets |= Q(resolution=resolution, start=start)
+        self.filter(buckets, choice_id__in=deltas).update(count=F('count') + choice_delta(deltas))
+
+    def totals_before(self, question_id, moment):
+        """
+        {choice id: votes} of a question just before moment: the hour
+        buckets up to the last whole hour plus the minute buckets after
+        it, as old minute buckets may have been pruned.
+        """
+        hour = VoteBucket.bucket_start(moment, VoteBucket.HOUR)
+        earlier = (
+            Q(resolution=VoteBucket.HOUR, start__lt=hour)
+            | Q(resolution=VoteBucket.MINUTE, start__gte=hour, start__lt=moment)
+        )
+        rows = self.filter(earlier, question_id=question_id).values_list('choice').annotate(total=Sum('count'))
+        return dict(rows.order_by())
+
+
+class VoteBucket(models.Model):
+    """
+    Net change of a choice's votes during one minute or hour.
+
+    A vote adds one to the bucket of its choice, a revote also takes one
+    from the bucket of the previous choice, so summing the buckets up to
+    a moment gives the tally at that moment.
+    """
+    MINUTE = 'minute'
+    HOUR = 'hour'
+    RESOLUTIONS = {MINUTE: datetime.timedelta(minutes=1), HOUR: datetime.timedelta(hours=1)}
+
+    question = models.ForeignKey(Question, on_delete=models.CASCADE)
+    choice = models.ForeignKey(Choice, on_delete=models.CASCADE)
+    resolution = models.CharField(max_length=6, choices=[(MINUTE, 'Minute'), (HOUR, 'Hour')])
+    start = models.DateTimeField()
+    count = models.IntegerField(default=0)
+
+    objects = VoteBucketManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['choice', 'resolution', 'start'], name='unique_vote_bucket'),
+        ]
+        indexes = [
+            models.Index(fields=['question', 'resolution', 'start'], name='vote_bucket_range_idx'),
+        ]
+
+    @staticmethod
+    def bucket_start(when, resolution):
+        """Start of the bucket of the given resolution containing when"""
+        when = when.replace(second=0, microsecond=0)
+        if resolution == VoteBucket.HOUR:
+            when = when.replace(minute=0)
+        return when
 
-    @property
     def __str__(self):
-        return f"user={self.user}, question={self.choice.question}, choice={self.choice.choice_text}"
+        return f"{self.choice} {self.resolution} {self.start:%Y-%m-%d %H:%M}: {self.count:+d}"
+
+
+class VoteShardManager(models.Manager):
+    """Sharded vote counters"""
+
+    def add(self, deltas, choice_question):
+        """
+        Add per-choice deltas to one randomly picked shard and bump its
+        version. Concurrent votes for the same choice mostly land on
+        different rows, so they do not queue behind a single row lock.
+        """
+        shard = random.randrange(settings.POLLS_VOTE_SHARDS)
+        self.bulk_create(
+            [VoteShard(question_id=choice_question[choice_id], choice_id=choice_id, shard=shard) for choice_id in deltas],
+            ignore_conflicts=True,
+        )
+        self.filter(shard=shard, choice_id__in=deltas).update(
+            count=F('count') + choice_delta(deltas), version=F('version') + 1,
+        )
+
+    def compact(self, question_ids=None):
+        """
+        Fold the shards into Choice.vote_count and Question.vote_version,
+        and record the folded votes in the history buckets as of now.
+        Totals and results versions do not change. Returns the number of
+        shards folded.
+
+        The folded counts are subtracted rather than the rows deleted: an
+        add() that inserted its shard before the fold updates it after,
+        and that update must still find the row.
+        """
+        shards = self.select_for_update().exclude(count=0, version=0)
+        if question_ids is not None:
+            shards = shards.filter(question_id__in=question_ids)
+        with transaction.atomic():
+            rows = list(shards.values_list('pk', 'question_id', 'choice_id', 'count', 'version'))
+            totals, versions, choice_question = defaultdict(int), defaultdict(int), {}
+            for _, question_id, choice_id, count, version in rows:
+                totals[choice_id] += count
+                versions[question_id] += version
+                choice_question[choice_id] = question_id
+            totals = {choice_id: total for choice_id, total in totals.items() if total}
+            versions = {question_id: version for question_id, version in versions.items() if version}
+            for delta, ids in group_by_delta(totals).items():
+                Choice.objects.filter(pk__in=ids).update(vote_count=F('vote_count') + delta)
+            for delta, ids in group_by_delta(versions).items():
+                Question.objects.filter(pk__in=ids).update(vote_version=F('vote_version') + delta)
+            VoteBucket.objects.record(totals, choice_question, timezone.now())
+            folded = {pk: (count, version) for pk, _, _, count, version in rows}
+            for (count, version), pks in group_by_delta(folded).items():
+                self.filter(pk__in=pks).update(count=F('count') - count, version=F('version') - version)
+        return len(rows)
+
+
+class VoteShard(models.Model):
+    """
+    One of POLLS_VOTE_SHARDS partial counters of a choice.
+
+    A choice's total is its vote_count plus the counts of its shards, and
+    a question's results version its vote_version plus the versions of
+    its shards, so a vote writes nothing but its shard. Compaction (the
+    compact_vote_shards command) moves both back into the choice and the
+    question, records the votes in the history buckets, which therefore
+    lag by up to the compaction interval, and leaves the rows at zero.
+    """
+    question = models.ForeignKey(Question, on_delete=models.CASCADE)
+    choice = models.ForeignKey(Choice, on_delete=models.CASCADE)
+    shard = models.PositiveSmallIntegerField()
+    count = models.IntegerField(default=0)
+    version = models.PositiveIntegerField(default=0)
+
+    objects = VoteShardManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['choice', 'shard'], name='unique_vote_shard'),
+        ]
+
+    def __str__(self):
+        return f"{self.choice} shard {self.shard}: {self.count:+d}"
+
+
+def shard_total(field, column='count'):
+    """Sum of column over the shards of the outer choice or question, field is 'choice' or 'question'"""
+    shards = (
+        VoteShard.objects.filter(**{field: OuterRef('pk')})
+        .order_by().values(field).annotate(total=Sum(column)).values('total')
+    )
+    return Coalesce(Subquery(shards), 0)
@@ -0,0 +1,68 @@
+"""
+Keyset pagination of the poll index.
+
+Pages are ordered newest first on (pub_date, id). Instead of an OFFSET,
+the next page starts after a cursor holding the (pub_date, id) of the
+last question shown, so the database seeks straight to it through the
+question_pub_date_id_idx (or question_state_idx) index: page 1,000
+costs the same as page 1.
+"""
+import datetime
+
+from django.db.models import Q
+
+from .models import Question
+
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+STATE_FILTERS = (Question.OPEN, Question.CLOSED)
+
+
+class InvalidPage(ValueError):
+    """Malformed cursor or filter in the query string"""
+
+
+def encode_cursor(question):
+    """Opaque cursor pointing just after question"""
+    micros = (question.pub_date - EPOCH) // datetime.timedelta(microseconds=1)
+    return f'{micros}-{question.pk}'
+
+
+def decode_cursor(cursor):
+    """(pub_date, id) of a cursor made by encode_cursor()"""
+    try:
+        micros, pk = (int(part) for part in cursor.split('-'))
+    except ValueError:
+        raise InvalidPage(f"invalid cursor {cursor!r}")
+    return EPOCH + datetime.timedelta(microseconds=micros), pk
+
+
+def index_filters(params):
+    """(cursor, q, state) from the query string of the index"""
+    cursor = params.get('after') or None
+    if cursor is not None:
+        cursor = decode_cursor(cursor)
+    q = params.get('q', '').strip()
+    state = params.get('state') or None
+    if state is not None and state not in STATE_FILTERS:
+        raise InvalidPage(f"state must be one of {', '.join(STATE_FILTERS)}")
+    return cursor, q, state
+
+
+def question_page(now, cursor=None, q='', state=None, size=5):
+    """
+    Published questions newest first after cursor, matching q and state.
+    Returns the questions and the cursor of the next page, or None.
+    """
+    queryset = Question.objects.filter(pub_date__lte=now)
+    if state is not None:
+        queryset = queryset.filter(state=state)
+    if q:
+        # not indexable, but the scan stops as soon as the page is full
+        queryset = queryset.filter(question_text__icontains=q)
+    if cursor is not None:
+        pub_date, pk = cursor
+        # a range on pub_date the index can seek to, minus the ties already shown
+        queryset = queryset.filter(pub_date__lte=pub_date).exclude(Q(pub_date=pub_date) & Q(pk__gte=pk))
+    questions = list(queryset.order_by('-pub_date', '-pk')[:size + 1])
+    next_cursor = encode_cursor(questions[size - 1]) if len(questions) > size else None
+    return questions[:size], next_cursor
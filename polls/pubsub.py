@@ -0,0 +1,208 @@
+"""
+In-process publish/subscribe of live vote tallies.
+
+Every committed vote sends ``vote_recorded``; the broker marks the
+question dirty. A single background thread wakes up at most once per
+POLLS_RESULTS_STREAM_INTERVAL, computes the tally of each dirty question
+that has watchers with one query, and hands the same payload to every
+subscriber. N watchers therefore cost one tally query per change, not N.
+Watchers on an event loop get an AsyncSubscription, which the thread
+feeds through loop.call_soon_threadsafe, so waiting for a change holds
+no worker thread.
+
+Only votes recorded in this process are seen, run one process per poll
+or put a shared broker in front of several processes.
+"""
+import asyncio
+import logging
+import queue
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connection
+from django.dispatch import receiver
+
+from .models import vote_recorded
+from .tally import compute_tally
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    """Queue of tally payloads for one watcher of one question"""
+
+    def __init__(self, question_id, maxsize=16):
+        self.question_id = question_id
+        self.queue = queue.Queue(maxsize=maxsize)
+
+    def push(self, payload):
+        """Add a payload, dropping the oldest one if the watcher lags behind"""
+        while True:
+            try:
+                self.queue.put_nowait(payload)
+                return
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                except queue.Empty:
+                    pass
+
+    def get(self, timeout):
+        """Next payload, or None after timeout seconds"""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class AsyncSubscription:
+    """Queue of tally payloads for one watcher of one question, read on an event loop"""
+
+    def __init__(self, question_id, loop, maxsize=16):
+        self.question_id = question_id
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=maxsize)
+
+    def push(self, payload):
+        """Hand a payload over to the loop of the watcher, from any thread"""
+        try:
+            self.loop.call_soon_threadsafe(self._put, payload)
+        except RuntimeError:
+            # the loop is closed, the watcher is gone
+            pass
+
+    def _put(self, payload):
+        """Add a payload, dropping the oldest one if the watcher lags behind"""
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(payload)
+
+    async def get(self, timeout):
+        """Next payload, or None after timeout seconds"""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class TallyBroker:
+    """Fan tally updates out to every subscriber of a question"""
+
+    def __init__(self, interval=1.0, autostart=True):
+        self.interval = interval
+        self.autostart = autostart
+        self._subscribers = defaultdict(set)
+        self._latest = {}
+        self._dirty = set()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def subscribe(self, question_id, loop=None):
+        """Register a watcher of question_id, an async one read on loop if given"""
+        subscription = Subscription(question_id) if loop is None else AsyncSubscription(question_id, loop)
+        with self._lock:
+            self._subscribers[question_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            watchers = self._subscribers.get(subscription.question_id)
+            if watchers is not None:
+                watchers.discard(subscription)
+                if not watchers:
+                    del self._subscribers[subscription.question_id]
+                    self._latest.pop(subscription.question_id, None)
+
+    def subscriber_count(self, question_id):
+        with self._lock:
+            return len(self._subscribers.get(question_id, ()))
+
+    def snapshot(self, question_id):
+        """Latest payload shared by the watchers of question_id, computed if missing"""
+        with self._lock:
+            payload = self._latest.get(question_id)
+        if payload is None:
+            payload = compute_tally(question_id)
+            with self._lock:
+                if question_id in self._subscribers:
+                    self._latest.setdefault(question_id, payload)
+        return payload
+
+    def publish(self, question_id):
+        """Note that the tally of question_id changed"""
+        with self._lock:
+            if question_id not in self._subscribers:
+                return
+            self._dirty.add(question_id)
+        if self.autostart:
+            self._ensure_thread()
+            self._wakeup.set()
+
+    def process_pending(self):
+        """Compute each dirty tally once and push it to all its subscribers"""
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+        for question_id in dirty:
+            with self._lock:
+                if question_id not in self._subscribers:
+                    continue
+            payload = compute_tally(question_id)
+            with self._lock:
+                self._latest[question_id] = payload
+                watchers = list(self._subscribers.get(question_id, ()))
+            for subscription in watchers:
+                subscription.push(payload)
+        return len(dirty)
+
+    def _ensure_thread(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='polls-tally-broker', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        try:
+            while True:
+                self._wakeup.wait()
+                self._wakeup.clear()
+                try:
+                    self.process_pending()
+                except Exception:
+                    logger.exception("Pushing live tallies failed")
+                connection.close_if_unusable_or_obsolete()
+                # changes arriving during the pause are coalesced into the next push
+                time.sleep(self.interval)
+        finally:
+            connection.close()
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    """The process-wide tally broker"""
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            _broker = TallyBroker(interval=settings.POLLS_RESULTS_STREAM_INTERVAL)
+        return _broker
+
+
+@receiver(vote_recorded)
+def publish_votes(sender, question_ids, **kwargs):
+    """Forward committed votes to the broker"""
+    broker = get_broker()
+    for question_id in question_ids:
+        broker.publish(question_id)
+
+
+def reset_broker():
+    """Drop the broker, the next get_broker() reads the settings again"""
+    global _broker
+    with _broker_lock:
+        _broker = None
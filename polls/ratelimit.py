@@ -0,0 +1,181 @@
+"""
+Rate limiting of the write endpoints.
+
+Limits are rates such as ``"30/m"`` (30 requests a minute, in bursts of
+up to 30). POLLS_RATE_LIMITS maps URL names to rates and is enforced by
+``polls.middleware.RateLimitMiddleware`` before the view runs; the
+``rate_limit`` decorator sets a rate on a single view.
+
+A request from a logged in user is counted against the user at the rate,
+and against its IP at POLLS_RATE_LIMIT_USERS_PER_IP times the rate, so
+users behind one NAT or proxy do not throttle each other but one client
+cannot spread its votes over many accounts. Other requests are counted
+against their IP at the rate. The user is found without reading the
+session: the session key is mapped to its user in the cache at login,
+and again after a limited request that loaded the session anyway.
+
+The store is chosen by POLLS_RATE_LIMIT_STORE: ``memory`` keeps token
+buckets in this process, ``cache`` keeps sliding window counters in the
+default cache so several processes share them.
+"""
+import math
+import threading
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY
+from django.core.cache import cache
+from django.http import HttpResponse
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """(requests, seconds) of a rate like '30/m' or '5/10s'"""
+    count, _, period = rate.partition('/')
+    unit = period[-1:]
+    if unit not in PERIODS:
+        raise ValueError(f"invalid rate {rate!r}, expected e.g. '30/m'")
+    return int(count), int(period[:-1] or 1) * PERIODS[unit]
+
+
+class MemoryStore:
+    """Token buckets kept in this process"""
+
+    # Buckets kept before full ones are dropped
+    max_keys = 10000
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def hit(self, key, limit, period):
+        """Take a token from key's bucket. Returns 0 if allowed, else the seconds to wait."""
+        refill = limit / period
+        now = self.clock()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (limit, now))
+            tokens = min(limit, tokens + (now - updated) * refill)
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now)
+                wait = 0
+            else:
+                self._buckets[key] = (tokens, now)
+                wait = (1 - tokens) / refill
+            if len(self._buckets) > self.max_keys:
+                self._prune(now, refill)
+        return wait
+
+    def _prune(self, now, refill):
+        for key, (tokens, updated) in list(self._buckets.items()):
+            if (now - updated) * refill >= 1:
+                del self._buckets[key]
+
+
+class CacheStore:
+    """Sliding window counters in the Django cache, shared by every process"""
+
+    def __init__(self, clock=time.time):
+        self.clock = clock
+
+    def hit(self, key, limit, period):
+        """Count a request in key's window. Returns 0 if allowed, else the seconds to wait."""
+        now = self.clock()
+        window, elapsed = divmod(now, period)
+        current = f'polls:ratelimit:{key}:{int(window)}'
+        previous = f'polls:ratelimit:{key}:{int(window) - 1}'
+        counts = cache.get_many([current, previous])
+        weight = 1 - elapsed / period
+        estimate = counts.get(previous, 0) * weight + counts.get(current, 0)
+        if estimate + 1 > limit:
+            return period - elapsed
+        if not cache.add(current, 1, timeout=2 * period):
+            try:
+                cache.incr(current)
+            except ValueError:
+                cache.set(current, 1, timeout=2 * period)
+        return 0
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """The store selected by POLLS_RATE_LIMIT_STORE"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = CacheStore() if settings.POLLS_RATE_LIMIT_STORE == 'cache' else MemoryStore()
+        return _store
+
+
+def reset_store():
+    """Start from empty buckets, the next get_store() reads the settings again"""
+    global _store
+    with _store_lock:
+        _store = None
+
+
+def session_user_key(session_key):
+    return f'polls:ratelimit:session:{session_key}'
+
+
+def remember_session_user(session_key, user_id):
+    """Map a session to its logged in user for client_keys(), False if it already was"""
+    return cache.add(session_user_key(session_key), user_id, timeout=settings.SESSION_COOKIE_AGE)
+
+
+def remember_request_user(request, scope, rate):
+    """
+    Map the session of request to its user if the view loaded the session
+    anyway. The request was only counted against its IP, count it against
+    the user too.
+    """
+    session = getattr(request, 'session', None)
+    if session is None or not session.accessed or not session.session_key:
+        return
+    user_id = session.get(SESSION_KEY)
+    if user_id is not None and remember_session_user(session.session_key, user_id):
+        limit, period = parse_rate(rate)
+        get_store().hit(f'{scope}:user:{user_id}', limit, period)
+
+
+def client_keys(request):
+    """(key, multiple of the rate) pairs a request is counted under, see the module docstring"""
+    address = request.META.get('REMOTE_ADDR', '')
+    session_key = request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    # the cookie comes from the client, only well formed session keys are looked up
+    user_id = cache.get(session_user_key(session_key)) if session_key and session_key.isalnum() else None
+    if user_id is None:
+        return [(f'ip:{address}', 1)]
+    return [(f'user:{user_id}', 1), (f'ip-users:{address}', settings.POLLS_RATE_LIMIT_USERS_PER_IP)]
+
+
+def check(request, scope, rate):
+    """None if request is within rate for scope, else a 429 response"""
+    limit, period = parse_rate(rate)
+    store = get_store()
+    for key, multiple in client_keys(request):
+        wait = store.hit(f'{scope}:{key}', limit * multiple, period)
+        if wait:
+            response = HttpResponse("Too many requests, slow down.", status=429, content_type='text/plain')
+            response['Retry-After'] = str(math.ceil(wait))
+            return response
+    return None
+
+
+def rate_limit(rate, scope=None):
+    """Limit a view to rate per client, counted under scope (the view's name by default)"""
+    def decorator(view):
+        name = scope or f'{view.__module__}.{view.__qualname__}'
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if not settings.POLLS_RATE_LIMIT_ENABLED:
+                return view(request, *args, **kwargs)
+            return check(request, name, rate) or view(request, *args, **kwargs)
+        return wrapper
+    return decorator
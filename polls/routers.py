@@ -0,0 +1,62 @@
+"""
+Read replica routing.
+
+When POLLS_REPLICA_DATABASE names a database alias, GET requests of the
+views in POLLS_REPLICA_VIEWS read polls models from it; everything else,
+writes included, stays on the primary. ``ReplicaRoutingMiddleware``
+decides per request and sets ``read_alias`` for the duration of the
+view, ``ReplicaRouter`` reads it.
+
+A client that just wrote something, a vote say, is sent a short-lived
+STICKY_COOKIE and reads from the primary until it expires, so it sees
+its own writes even while the replica lags behind.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+STICKY_COOKIE = 'polls_primary'
+
+# Alias polls reads go to in the current request, None for the primary
+read_alias = ContextVar('polls_read_alias', default=None)
+
+
+@contextmanager
+def primary():
+    """Read from the primary inside the block, e.g. to fill a shared cache"""
+    token = read_alias.set(None)
+    try:
+        yield
+    finally:
+        read_alias.reset(token)
+
+
+def replica_for(request):
+    """The alias request may read from, None if it must read from the primary"""
+    alias = settings.POLLS_REPLICA_DATABASE
+    if not alias or request.method not in ('GET', 'HEAD') or STICKY_COOKIE in request.COOKIES:
+        return None
+    match = request.resolver_match
+    if match is None or match.view_name not in settings.POLLS_REPLICA_VIEWS:
+        return None
+    return alias
+
+
+class ReplicaRouter:
+    """Send reads of polls models to read_alias, leave everything else to the default"""
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label == 'polls':
+            return read_alias.get()
+        return None
+
+    def db_for_write(self, model, **hints):
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        """The replica holds the same rows, so objects from both may be related"""
+        databases = {'default', settings.POLLS_REPLICA_DATABASE}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
@@ -0,0 +1,60 @@
+from django.contrib.auth.models import User
+from django.contrib.auth.signals import user_logged_in
+from django.core.signals import setting_changed
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import ingest, pubsub, ratelimit, tally
+from .auth import forget_user
+from .cache import bump_index_version
+from .models import Choice, Question
+
+# Process-wide objects built from settings, by the prefix of the settings they read
+SETTING_RESETS = (
+    ('POLLS_RATE_LIMIT', ratelimit.reset_store),
+    ('POLLS_VOTE_', ingest.reset_ingestor),
+    ('POLLS_RESULTS_STREAM_INTERVAL', pubsub.reset_broker),
+    ('POLLS_TALLY_CACHE_SECONDS', tally.clear_cache),
+)
+
+
+@receiver([post_save, post_delete], sender=Question)
+@receiver([post_save, post_delete], sender=Choice)
+def invalidate_index(sender, **kwargs):
+    """Drop the cached index whenever a question or its choices change"""
+    bump_index_version()
+
+
+@receiver([post_save, post_delete], sender=Choice)
+def bump_results_version(sender, instance, **kwargs):
+    """Choice edits change the published results, so they get a new version"""
+    Question.objects.filter(pk=instance.question_id).update(vote_version=F('vote_version') + 1)
+
+
+@receiver(post_save, sender=Question)
+def bump_question_version(sender, instance, created, **kwargs):
+    """The results page shows the question too, an edited question gets a new version"""
+    if not created:
+        Question.objects.filter(pk=instance.pk).update(vote_version=F('vote_version') + 1)
+
+
+@receiver([post_save, post_delete], sender=User)
+def invalidate_user(sender, instance, **kwargs):
+    """Logins, password changes and deactivation must not be served from a stale cached user"""
+    forget_user(instance.pk)
+
+
+@receiver(user_logged_in)
+def remember_logged_in_session(sender, request, user, **kwargs):
+    """Rate limits count the new session against its user without reading it"""
+    if request is not None and getattr(request, 'session', None) is not None and request.session.session_key:
+        ratelimit.remember_session_user(request.session.session_key, user.pk)
+
+
+@receiver(setting_changed)
+def reset_for_setting(*, setting, **kwargs):
+    """Rebuild what was built from a setting when a test overrides it"""
+    for prefix, reset in SETTING_RESETS:
+        if setting.startswith(prefix):
+            reset()
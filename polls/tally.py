@@ -0,0 +1,79 @@
+"""Vote tallies as plain data, for the JSON API and the live stream."""
+import threading
+import time
+
+from django.conf import settings
+
+from .models import Choice
+
+# Tallies kept before the expired ones are dropped
+MAX_CACHED_TALLIES = 1000
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def compute_tallies(question_ids):
+    """
+    Vote counts of every choice of each question, summed from the stored
+    tallies and their shards with a single query. Unknown ids get an
+    empty tally.
+    """
+    tallies = {
+        question_id: {'question': question_id, 'total_votes': 0, 'choices': []}
+        for question_id in question_ids
+    }
+    choices = (
+        Choice.objects.filter(question_id__in=tallies).with_votes()
+        .order_by('question_id', 'pk')
+        .values_list('question_id', 'id', 'choice_text', 'vote_count', 'shard_votes')
+    )
+    for question_id, choice_id, text, vote_count, shard_votes in choices:
+        votes = vote_count + shard_votes
+        tally = tallies[question_id]
+        tally['choices'].append({'id': choice_id, 'text': text, 'votes': votes})
+        tally['total_votes'] += votes
+    return tallies
+
+
+def compute_tally(question_id):
+    """Tally of a single question"""
+    return compute_tallies([question_id])[question_id]
+
+
+def cached_tallies(versions):
+    """
+    compute_tallies() for a {question id: vote version} map, reusing the
+    tallies computed in this process for the same versions during the
+    last POLLS_TALLY_CACHE_SECONDS. A vote bumps the version, so a cached
+    tally never disagrees with the version (and ETag) it is served with.
+    """
+    max_age = settings.POLLS_TALLY_CACHE_SECONDS
+    if max_age <= 0:
+        return compute_tallies(versions)
+    now = time.monotonic()
+    with _cache_lock:
+        found = {}
+        for question_id, version in versions.items():
+            entry = _cache.get((question_id, version))
+            if entry is not None and entry[0] > now:
+                found[question_id] = entry[1]
+    missing = [question_id for question_id in versions if question_id not in found]
+    if missing:
+        computed = compute_tallies(missing)
+        with _cache_lock:
+            if len(_cache) + len(computed) > MAX_CACHED_TALLIES:
+                for key in [key for key, (expires, _) in _cache.items() if expires <= now]:
+                    del _cache[key]
+                if len(_cache) + len(computed) > MAX_CACHED_TALLIES:
+                    _cache.clear()
+            for question_id, tally in computed.items():
+                _cache[(question_id, versions[question_id])] = (now + max_age, tally)
+        found.update(computed)
+    return found
+
+
+def clear_cache():
+    """Forget every cached tally"""
+    with _cache_lock:
+        _cache.clear()
@@ -0,0 +1,152 @@
+import datetime
+import re
+import unittest
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from .cache import get_index_questions
+from .models import Choice, Question, Vote
+from .pagination import encode_cursor, question_page
+from .views import get_vote_for_user, results_queryset
+
+
+class QueryPlanAssertions:
+    """Helpers to check the SQLite query plan of the queries a callable runs"""
+
+    def query_plans(self, func):
+        """Run func and return the EXPLAIN QUERY PLAN rows of every SELECT it issued."""
+        with CaptureQueriesContext(connection) as context:
+            func()
+        plans = []
+        with connection.cursor() as cursor:
+            for query in context.captured_queries:
+                if query['sql'].startswith('SELECT'):
+                    cursor.execute('EXPLAIN QUERY PLAN ' + query['sql'])
+                    plans.append((query['sql'], [row[-1] for row in cursor.fetchall()]))
+        self.assertTrue(plans, "no SELECT was issued")
+        return plans
+
+    def assertIndexed(self, func, table):
+        """Every step touching table uses an index and nothing sorts in a temp b-tree."""
+        for sql, steps in self.query_plans(func):
+            touched = [step for step in steps if re.search(rf' {table}\b', step)]
+            for step in touched:
+                self.assertIn('INDEX', step, f"full scan in {sql!r}: {steps}")
+            for step in steps:
+                self.assertNotIn('TEMP B-TREE', step, f"unindexed sort in {sql!r}: {steps}")
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', "EXPLAIN QUERY PLAN is SQLite specific")
+class HotQueryPlanTests(QueryPlanAssertions, TestCase):
+    """The hot queries must be answered from an index, never a full table scan."""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.user = User.objects.create_user(username="planner", password="FatChance!")
+        self.question = Question.objects.create(
+            question_text="Plan q", pub_date=timezone.now() - datetime.timedelta(days=1)
+        )
+        self.choice = Choice.objects.create(question=self.question, choice_text="Plan")
+
+    def test_index_page_questions(self):
+        """Published questions ordered by -pub_date come from question_pub_date_id_idx."""
+        self.assertIndexed(get_index_questions, 'polls_question')
+
+    def test_questions_by_state(self):
+        """Open questions newest first come from question_state_idx."""
+        self.assertIndexed(
+            lambda: list(Question.objects.filter(state=Question.OPEN).order_by('-pub_date')[:5]),
+            'polls_question',
+        )
+
+    def test_vote_for_user(self):
+        """The user's vote on a question is found through the (user, question) constraint."""
+        self.assertIndexed(lambda: get_vote_for_user(self.question, self.user), 'polls_vote')
+
+    def test_cast_vote(self):
+        """Casting a vote looks up the existing vote through an index."""
+        self.assertIndexed(lambda: Vote.objects.cast(self.user, self.choice), 'polls_vote')
+
+    def test_count_votes_for_choice(self):
+        """Counting the votes of one choice uses the choice index."""
+        self.assertIndexed(lambda: Vote.objects.filter(choice=self.choice).count(), 'polls_vote')
+
+    def test_count_votes_for_question(self):
+        """Per-choice counts of one question are served by vote_question_choice_idx."""
+        self.assertIndexed(
+            lambda: list(Vote.objects.filter(question=self.question).values('choice').order_by('choice')),
+            'polls_vote',
+        )
+
+    def test_shard_sums(self):
+        """The results query sums the vote shards of the question and of each choice from an index."""
+        Vote.objects.cast(self.user, self.choice)
+        self.assertIndexed(lambda: results_queryset().get(pk=self.question.pk), 'polls_voteshard')
+
+    def test_recount(self):
+        """recount_votes groups votes by choice from an index."""
+        self.assertIndexed(lambda: call_command('recount_votes', '--dry-run', stdout=StringIO()), 'polls_vote')
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', "EXPLAIN QUERY PLAN is SQLite specific")
+class KeysetPaginationPlanTests(QueryPlanAssertions, TestCase):
+    """Deep index pages seek through an index with the same plan as the first pages."""
+
+    QUESTIONS = 3000
+
+    def setUp(self):
+        super().setUp()
+        now = timezone.now()
+        # pairs of questions share a pub_date so the id tie-breaker is exercised
+        Question.objects.bulk_create(
+            Question(question_text=f"Archived {n}", pub_date=now - datetime.timedelta(minutes=n // 2 + 10),
+                     state=Question.CLOSED if n % 3 else Question.OPEN)
+            for n in range(self.QUESTIONS)
+        )
+        self.now = now
+        self.questions = list(Question.objects.order_by('-pub_date', '-pk'))
+
+    def plan_after(self, position, **filters):
+        cursor = (self.questions[position].pub_date, self.questions[position].pk)
+        plans = self.query_plans(lambda: question_page(self.now, cursor, **filters))
+        self.assertEqual(len(plans), 1)
+        return plans[0][1]
+
+    def test_deep_page_same_plan(self):
+        """Page 600 is planned exactly like page 2."""
+        self.assertEqual(self.plan_after(5), self.plan_after(2995))
+        self.assertIndexed(
+            lambda: question_page(self.now, (self.questions[2995].pub_date, self.questions[2995].pk)),
+            'polls_question',
+        )
+
+    def test_state_filter(self):
+        """Filtering on state seeks through question_state_idx."""
+        self.assertEqual(self.plan_after(5, state=Question.OPEN), self.plan_after(2995, state=Question.OPEN))
+        self.assertTrue(any('question_state_idx' in step for step in self.plan_after(2995, state=Question.OPEN)))
+
+    def test_text_filter_walks_index(self):
+        """The text filter is checked while walking the pub_date index, never sorted."""
+        self.assertIndexed(lambda: question_page(self.now, q='archived 29'), 'polls_question')
+
+    def test_walk_every_page(self):
+        """Following the cursors visits every question once, one query per page."""
+        seen, cursor = [], None
+        while True:
+            with self.assertNumQueries(1):
+                page, next_cursor = question_page(self.now, cursor, size=250)
+            seen += [question.pk for question in page]
+            if next_cursor is None:
+                break
+            last = page[-1]
+            self.assertEqual(next_cursor, encode_cursor(last))
+            cursor = (last.pub_date, last.pk)
+        self.assertEqual(seen, [question.pk for question in self.questions])
@@ -1,15 +1,32 @@
+from django.conf import settings
 from django.urls import path
 
-from . import views
+from . import async_views, views
+
+
+def build_urlpatterns(hot_views):
+    """URL patterns of the app, with index, results and vote served by hot_views"""
+    return [
+        # ex: /polls/
+        path('', hot_views.IndexView.as_view(), name='index'),
+        # ex: /polls/5/
+        path('<int:question_id>/', views.DetailView.as_view(), name='detail'),
+        # ex: /polls/5/results/
+        path('<int:question_id>/results/', hot_views.ResultsView.as_view(), name='results'),
+        # ex: /polls/results.json?ids=1,2,3
+        path('results.json', views.bulk_results_json, name='bulk_results_json'),
+        # ex: /polls/5/results.json
+        path('<int:question_id>/results.json', views.results_json, name='results_json'),
+        # ex: /polls/5/history/?resolution=minute
+        path('<int:question_id>/history/', views.history, name='history'),
+        # ex: /polls/5/results/stream/
+        path('<int:question_id>/results/stream/', views.results_stream, name='results_stream'),
+        # ex: /polls/ballot/ with question-5=12&question-6=15
+        path('ballot/', views.ballot, name='ballot'),
+        # ex: /polls/5/vote/
+        path('<int:question_id>/vote/', hot_views.vote, name='vote'),
+    ]
+
 
 app_name = "polls"
-urlpatterns = [
-    # ex: /polls/
-    path('', views.IndexView.as_view(), name='index'),
-    # ex: /polls/5/
-    path('<int:question_id>/', views.DetailView.as_view(), name='detail'),
-    # ex: /polls/5/results/
-    path('<int:question_id>/results/', views.ResultsView.as_view(), name='results'),
-    # ex: /polls/5/vote/
-    path('<int:question_id>/vote/', views.vote, name='vote'),
-]
+urlpatterns = build_urlpatterns(async_views if settings.POLLS_ASYNC_VIEWS else views)
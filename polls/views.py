@@ -1,26 +1,67 @@
 from django.shortcuts import render, get_object_or_404, redirect
-from django.http import HttpResponseRedirect
+from django.http import (
+    Http404, HttpResponse, HttpResponseBadRequest, HttpResponseRedirect, JsonResponse, StreamingHttpResponse,
+)
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.utils.decorators import method_decorator
 from django.views import generic
 from django.urls import reverse
 from django.utils import timezone
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.contrib.admin.views.decorators import staff_member_required
+import asyncio
+import datetime
+import hashlib
+import json
 import logging
+from asgiref.sync import sync_to_async
 from django.contrib.auth.models import User
+from django.db.models import Prefetch, prefetch_related_objects
+from django.utils.dateparse import parse_datetime
+from django.views.decorators.http import condition, require_GET, require_POST
 
-from .models import Choice, Question, Vote
+from . import ingest
+from .cache import (
+    INDEX_SIZE, cache_page_by, closed_results_page_key, first_index_page, get_index_questions, get_page,
+    index_cache_stats, index_page_key, page_cache_stats, store_page,
+)
+from .metrics import registry
+from .middleware import get_request_cache, memoize
+from .models import Choice, Question, Vote, VoteBucket
+from .pagination import STATE_FILTERS, InvalidPage, index_filters, question_page
+from .pubsub import get_broker
+from .tally import cached_tallies
 
 
+@method_decorator(cache_page_by('index', index_page_key, vary_on_cookie=True), name='get')
 class IndexView(generic.ListView):
     template_name = 'polls/index.html'
     context_object_name = 'latest_question_list'
 
+    def get(self, request, *args, **kwargs):
+        """Read the page cursor and the filters, 400 if they are malformed"""
+        try:
+            self.cursor, self.q, self.state = index_filters(request.GET)
+        except InvalidPage as error:
+            return HttpResponseBadRequest(str(error))
+        return super().get(request, *args, **kwargs)
+
     def get_queryset(self):
         """
         Excludes any questions that aren't published yet.
+        The unfiltered first page is cached until a question changes or the next one is published.
         """
-        return Question.objects.filter(pub_date__lte=timezone.now()).order_by("-pub_date")[:5]
+        questions, self.next_cursor = index_questions(self.cursor, self.q, self.state)
+        return questions
+
+    def get_context_data(self, **kwargs):
+        """Add the cursor of the next page and the filters"""
+        context = super().get_context_data(**kwargs)
+        context.update(index_context(self.next_cursor, self.q, self.state))
+        return context
 
 
 class DetailView(LoginRequiredMixin, generic.DetailView):
@@ -36,31 +77,280 @@ class DetailView(LoginRequiredMixin, generic.DetailView):
 
     def get(self, request, *args, **kwargs):
         """Check if the question is available to vote"""
-        question = get_object_or_404(Question, pk=kwargs["question_id"])
+        question = request_question(request, kwargs["question_id"])
         if not question.can_vote():
             messages.error(request, "Voting is not allow")
             return redirect('polls:index')
         if not request.user.is_authenticated:
             messages.error(request, "Please login first")
             return redirect('login')
-        select_vote = get_vote_for_user(question, request.user)
-        return render(request, 'polls/detail.html', {'question': question, 'vote': select_vote})
+        return render(request, 'polls/detail.html', {
+            'question': question,
+            'choices': request_choices(request, question),
+            'vote': request_vote(request, question),
+        })
 
 
 class ResultsView(generic.DetailView):
-    """Result view page"""
+    """Result view page, cached once the question is closed"""
     model = Question
     template_name = 'polls/results.html'
+    pk_url_kwarg = 'question_id'
+
+    def get_queryset(self):
+        """
+        Load the question with its vote total and its choices in a fixed
+        number of queries, whatever the number of choices.
+        """
+        return results_queryset()
+
+    def get_object(self, queryset=None):
+        """The question with its vote total, choices are only loaded on a page cache miss"""
+        return super().get_object(self.get_queryset().prefetch_related(None))
+
+    def get(self, request, *args, **kwargs):
+        self.object = self.get_object()
+        page = closed_results_page_key(self.object)
+        response = get_page('results', page)
+        if response is None:
+            prefetch_related_objects([self.object], RESULT_CHOICES)
+            response = self.render_to_response(self.get_context_data(object=self.object))
+            if page:
+                store_page(*page, response)
+        return response
+
+    def get_context_data(self, **kwargs):
+        """Add the choices with their share of the total votes"""
+        context = super().get_context_data(**kwargs)
+        context.update(results_context(self.object))
+        return context
+
+
+def results_stream(request, question_id):
+    """
+    Server-Sent Events stream of the tally of a question.
+
+    The first event is the current tally, then one event follows each
+    change pushed by the broker, with comment lines as keep-alives.
+    Under ASGI the events come from an async generator, so a waiting
+    watcher does not keep the response from being sent. The watcher is
+    subscribed once the stream starts, a response that is never sent
+    leaves nothing behind.
+    """
+    question = get_object_or_404(Question, pk=question_id)
+    broker = get_broker()
+    keepalive = settings.POLLS_RESULTS_STREAM_KEEPALIVE
+
+    def events():
+        subscription = broker.subscribe(question.id)
+        try:
+            yield sse_event(broker.snapshot(question.id))
+            while True:
+                yield sse_event(subscription.get(timeout=keepalive))
+        finally:
+            broker.unsubscribe(subscription)
+
+    async def aevents():
+        # the broker thread feeds an asyncio queue, waiting holds no worker thread
+        subscription = broker.subscribe(question.id, loop=asyncio.get_running_loop())
+        try:
+            yield sse_event(await sync_to_async(broker.snapshot)(question.id))
+            while True:
+                yield sse_event(await subscription.get(timeout=keepalive))
+        finally:
+            broker.unsubscribe(subscription)
+
+    content = aevents() if isinstance(request, ASGIRequest) else events()
+    response = StreamingHttpResponse(content, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def sse_event(payload):
+    """Server-Sent Event carrying payload, a keep-alive comment if it is None"""
+    if payload is None:
+        return ": keep-alive\n\n"
+    return f"data: {json.dumps(payload)}\n\n"
+
+
+MAX_BULK_RESULTS = 100
+
+
+def results_etag(request, question_id):
+    """Strong ETag from the results version, read without touching Vote or Choice"""
+    version = Question.objects.with_version().filter(pk=question_id).values_list('results_version', flat=True).first()
+    # kept for the view, so a full response does not read the version twice
+    request.results_version = version
+    if version is None:
+        return None
+    return f'"{question_id}-{version}"'
+
+
+@require_GET
+@condition(etag_func=results_etag)
+def results_json(request, question_id):
+    """Vote counts of one question as JSON"""
+    version = request.results_version
+    if version is None:
+        raise Http404("No question matches the given query.")
+    return JsonResponse({**cached_tallies({question_id: version})[question_id], 'version': version})
+
+
+def bulk_question_ids(request):
+    """Question ids from ?ids=1,2,3, or None if they are malformed"""
+    try:
+        ids = sorted({int(value) for value in request.GET.get('ids', '').split(',') if value})
+    except ValueError:
+        return None
+    if not ids or len(ids) > MAX_BULK_RESULTS:
+        return None
+    return ids
+
+
+def bulk_results_etag(request):
+    """ETag covering the vote versions of every requested question"""
+    ids = bulk_question_ids(request)
+    if ids is None:
+        return None
+    versions = list(
+        Question.objects.with_version().filter(pk__in=ids).order_by('pk').values_list('pk', 'results_version')
+    )
+    request.results_versions = dict(versions)
+    digest = hashlib.sha1(repr(versions).encode()).hexdigest()
+    return f'"{digest}"'
+
+
+@require_GET
+@condition(etag_func=bulk_results_etag)
+def bulk_results_json(request):
+    """Vote counts of several questions as JSON, ?ids=1,2,3"""
+    ids = bulk_question_ids(request)
+    if ids is None:
+        return HttpResponseBadRequest(f"ids must be 1 to {MAX_BULK_RESULTS} comma separated question ids")
+    versions = request.results_versions
+    tallies = cached_tallies(versions)
+    return JsonResponse({
+        'results': [{**tallies[question_id], 'version': version} for question_id, version in sorted(versions.items())],
+    })
+
+
+# Default window of /history/ per resolution
+HISTORY_WINDOW = {VoteBucket.MINUTE: datetime.timedelta(hours=1), VoteBucket.HOUR: datetime.timedelta(days=2)}
+
+
+def history_bound(request, name, default):
+    """UTC datetime from the query string, None if malformed"""
+    value = request.GET.get(name)
+    if not value:
+        return default
+    moment = parse_datetime(value)
+    if moment is None:
+        return None
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    # buckets start on whole UTC hours, an offset like +05:30 must not shift the truncation
+    return moment.astimezone(datetime.timezone.utc)
+
+
+@require_GET
+def history(request, question_id):
+    """
+    Vote history of a question as JSON, read from the rollup buckets.
+
+    ?resolution=minute|hour&start=<iso>&end=<iso>. Each bucket gives the
+    net change of every choice and the running totals after it.
+    """
+    question = get_object_or_404(Question.objects.only('id'), pk=question_id)
+    resolution = request.GET.get('resolution', VoteBucket.HOUR)
+    if resolution not in VoteBucket.RESOLUTIONS:
+        return HttpResponseBadRequest("resolution must be 'minute' or 'hour'")
+    end = history_bound(request, 'end', timezone.now())
+    start = history_bound(request, 'start', end and end - HISTORY_WINDOW[resolution])
+    if start is None or end is None or start > end:
+        return HttpResponseBadRequest("start and end must be ISO 8601 datetimes with start <= end")
+    start = VoteBucket.bucket_start(start, resolution)
+    buckets = VoteBucket.objects.filter(question=question, resolution=resolution)
+    totals = {choice_id: 0 for choice_id in question.choice_set.values_list('pk', flat=True)}
+    totals.update(VoteBucket.objects.totals_before(question.id, start))
+    series = []
+    rows = buckets.filter(start__gte=start, start__lte=end).order_by('start', 'choice')
+    for row in rows.values_list('start', 'choice', 'count'):
+        moment, choice_id, count = row
+        if not series or series[-1]['start'] != moment:
+            series.append({'start': moment, 'changes': {}, 'totals': None})
+        series[-1]['changes'][choice_id] = count
+        totals[choice_id] = totals.get(choice_id, 0) + count
+        series[-1]['totals'] = dict(totals)
+    return JsonResponse({
+        'question': question.id,
+        'resolution': resolution,
+        'start': start,
+        'end': end,
+        'buckets': series,
+    })
+
+
+def index_questions(cursor, q, state):
+    """One page of the index and the cursor of the next page"""
+    if cursor is None and not q and state is None:
+        return first_index_page(get_index_questions())
+    return question_page(timezone.now(), cursor, q, state, size=INDEX_SIZE)
+
+
+def index_context(next_cursor, q, state):
+    """Template context of the pagination and filters of the index"""
+    return {'next_cursor': next_cursor, 'q': q, 'state': state, 'states': STATE_FILTERS}
+
+
+RESULT_CHOICES = Prefetch('choice_set', queryset=Choice.objects.with_votes().order_by('pk'), to_attr='result_choices')
+
+
+def results_queryset():
+    """Questions annotated with their vote total and results version, choices prefetched in order"""
+    return Question.objects.with_votes().with_version().prefetch_related(RESULT_CHOICES)
+
+
+def results_context(question):
+    """Template context for a question loaded through results_queryset()"""
+    total = question.total_votes
+    choices = question.result_choices
+    for choice in choices:
+        choice.percentage = round(100 * choice.votes / total, 1) if total else 0
+    return {'question': question, 'choices': choices, 'total_votes': total}
 
 
 def get_vote_for_user(question: Question, user: User):
     """Get vote for user in each question"""
     try:
-        return Vote.objects.get(user=user, choice__question=question)
+        return Vote.objects.get(user=user, question=question)
     except Vote.DoesNotExist:
         return None
 
 
+def request_question(request, question_id):
+    """The question with question_id, loaded once per request, or 404"""
+    return memoize(request, ('question', question_id), lambda: get_object_or_404(Question, pk=question_id))
+
+
+def request_choices(request, question):
+    """The choices of question in display order, loaded once per request"""
+    return memoize(request, ('choices', question.pk), lambda: list(question.choice_set.order_by('pk')))
+
+
+def request_vote(request, question):
+    """The current user's vote on question, looked up once per request"""
+    return memoize(request, ('vote', question.pk), lambda: get_vote_for_user(question, request.user))
+
+
+def find_choice(choices, choice_id):
+    """The choice with choice_id among choices, or None"""
+    for choice in choices:
+        if str(choice.pk) == str(choice_id):
+            return choice
+    return None
+
+
 @login_required
 def vote(request, question_id):
     """
@@ -69,25 +359,92 @@ def vote(request, question_id):
         Returns:
         HttpResponseObject -- vote page
         """
-    question = get_object_or_404(Question, pk=question_id)
+    question = request_question(request, question_id)
     user = request.user
-    try:
-        selected_choice = question.choice_set.get(pk=request.POST['choice'])
-    except (KeyError, Choice.DoesNotExist):
+    choices = request_choices(request, question)
+    selected_choice = find_choice(choices, request.POST.get('choice'))
+    if selected_choice is None:
         return render(request, 'polls/detail.html', {
             'question': question,
+            'choices': choices,
             'error_message': "You didn't select a choice.",
         })
     else:
-        # selected_choice.votes += 1
-        # selected_choice.save()
-        select_vote = get_vote_for_user(question, request.user)
-        if not get_vote_for_user(question, request.user):
-            Vote.objects.create(user=request.user, choice=selected_choice)
+        if ingest.is_enabled():
+            ingest.get_ingestor().submit(user.pk, selected_choice.pk)
         else:
-            select_vote.choice = selected_choice
-        select_vote.save()
+            Vote.objects.cast(user, selected_choice)
+        get_request_cache(request).pop(('vote', question.pk), None)
         # Always return an HttpResponseRedirect after successfully dealing
         # with POST data. This prevents data from being posted twice if a
         # user hits the Back button.
         return HttpResponseRedirect(reverse('polls:results', args=(question.id,)))
+
+
+@staff_member_required
+@require_GET
+def metrics(request):
+    """Per-view request and query metrics for Prometheus, staff only"""
+    index = index_cache_stats()
+    caches = {'index': {'hits': index['hits'], 'misses': index['misses']}}
+    caches.update((f'{name}_page', stats) for name, stats in page_cache_stats().items())
+    return HttpResponse(
+        registry.render(settings.POLLS_METRICS_SAMPLE_RATE, caches),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
+
+
+# Largest number of questions answered by one ballot
+MAX_BALLOT = 100
+
+
+def ballot_entries(request):
+    """{question_id: choice_id} from question-<id>=<choice id> fields, None if malformed"""
+    entries = {}
+    for name, values in request.POST.lists():
+        if not name.startswith('question-'):
+            continue
+        try:
+            question_id = int(name[len('question-'):])
+            [choice_id] = [int(value) for value in values]
+        except ValueError:
+            return None
+        entries[question_id] = choice_id
+    if not entries or len(entries) > MAX_BALLOT:
+        return None
+    return entries
+
+
+@login_required
+@require_POST
+def ballot(request):
+    """
+    Vote on several questions at once from question-<id>=<choice id>
+    fields. All pairs are checked with one query and applied in one
+    transaction; nothing is recorded if any of them is invalid.
+    """
+    entries = ballot_entries(request)
+    if entries is None:
+        return JsonResponse(
+            {'error': f"post between 1 and {MAX_BALLOT} question-<id>=<choice id> fields"}, status=400,
+        )
+    rows = Choice.objects.filter(pk__in=entries.values()).values_list(
+        'pk', 'question_id', 'question__pub_date', 'question__end_date',
+    )
+    found = {pk: (question_id, pub_date, end_date) for pk, question_id, pub_date, end_date in rows}
+    now = timezone.now()
+    errors = {}
+    for question_id, choice_id in entries.items():
+        choice_question, pub_date, end_date = found.get(choice_id, (None, None, None))
+        if choice_question != question_id:
+            errors[question_id] = "not a choice of this question"
+        elif not pub_date <= now or (end_date is not None and now > end_date):
+            errors[question_id] = "voting is not allowed"
+    if errors:
+        return JsonResponse({'errors': errors}, status=400)
+    # one transaction, and one vote_version bump for every question whose results changed
+    changed = Vote.objects.bulk_cast(
+        [(request.user.pk, choice_id) for choice_id in entries.values()],
+        choice_question={choice_id: question_id for question_id, choice_id in entries.items()},
+    )
+    return JsonResponse({'questions': sorted(entries), 'changed': changed})